@@ -23,5 +23,10 @@ MODEL_CONFIG = {
         "initial_samples": 1000,
         "weekly_samples": 200,
         "validation_split": 0.1
+    },
+    "data_loader": {
+        "shuffle_buffer_size": 10000,  # Samples held for shuffling
+        "readers": 4,  # Shards decoded in parallel
+        "seed": 42
     }
 }
\ No newline at end of file
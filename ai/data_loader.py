@@ -0,0 +1,142 @@
+# Streaming Training Data Loader
+import json
+import mmap
+import os
+import random
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from config import MODEL_CONFIG
+
+MANIFEST_NAME = "manifest.json"
+
+# Compressed bytes handed to zlib per step
+READ_BLOCK_SIZE = 1 << 20
+
+def read_manifest(dataset_dir: str) -> Dict[str, Any]:
+    """Load the manifest written next to a dataset's shards"""
+    with open(os.path.join(dataset_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+def find_datasets(root: str) -> List[str]:
+    """Dataset directories under root, oldest first"""
+    if not os.path.isdir(root):
+        return []
+    datasets = []
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        if os.path.isfile(os.path.join(directory, MANIFEST_NAME)):
+            datasets.append((read_manifest(directory)["created_at"], directory))
+    return [directory for _, directory in sorted(datasets)]
+
+def read_shard(path: str) -> List[Dict[str, Any]]:
+    """Decode a gzip JSONL shard from a memory map, without reading the file into a buffer first"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            decompressor = zlib.decompressobj(wbits=31)  # gzip container
+            rows: List[Dict[str, Any]] = []
+            pending = b""
+            for offset in range(0, len(mapped), READ_BLOCK_SIZE):
+                lines = (pending + decompressor.decompress(mapped[offset:offset + READ_BLOCK_SIZE])).split(b"\n")
+                pending = lines.pop()
+                rows.extend(json.loads(line) for line in lines if line)
+            pending += decompressor.flush()
+            rows.extend(json.loads(line) for line in pending.split(b"\n") if line)
+            return rows
+
+class StreamingDataLoader:
+    """
+    Stream batches from sharded datasets without loading them whole.
+    Shards are decoded by a pool of reader threads (zlib releases the GIL) a few at a time,
+    in a seeded order, and samples pass through a bounded shuffle buffer. Memory is about
+    readers shards plus the buffer, and the batches depend only on the seed and epoch.
+    """
+
+    def __init__(self, dataset_dirs: List[str], split: str = "train", batch_size: Optional[int] = None,
+                 shuffle_buffer_size: Optional[int] = None, readers: Optional[int] = None,
+                 seed: Optional[int] = None, max_samples: Optional[int] = None):
+        loader_config = MODEL_CONFIG["data_loader"]
+        self.dataset_dirs = dataset_dirs
+        self.split = split
+        self.batch_size = batch_size or MODEL_CONFIG["fine_tuned_model"]["training_batch_size"]
+        self.shuffle_buffer_size = shuffle_buffer_size if shuffle_buffer_size is not None else loader_config["shuffle_buffer_size"]
+        self.readers = readers or loader_config["readers"]
+        self.seed = seed if seed is not None else loader_config["seed"]
+        self.max_samples = max_samples
+
+    def shards(self) -> List[Tuple[str, int]]:
+        """(path, rows) of every shard in the split, in manifest order"""
+        shards = []
+        for dataset_dir in self.dataset_dirs:
+            for shard in read_manifest(dataset_dir)["shards"]:
+                if shard["split"] == self.split:
+                    shards.append((os.path.join(dataset_dir, shard["path"]), shard["rows"]))
+        return shards
+
+    def __len__(self) -> int:
+        rows = sum(rows for _, rows in self.shards())
+        return min(rows, self.max_samples) if self.max_samples is not None else rows
+
+    def _iter_shard_rows(self, rng: random.Random) -> Iterator[Dict[str, Any]]:
+        shards = self.shards()
+        rng.shuffle(shards)
+        executor = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="shard-reader")
+        pending: Deque[Tuple[str, int, "Future[List[Dict[str, Any]]]"]] = deque()
+        remaining = iter(shards)
+        try:
+            while True:
+                # Keep one shard per reader decoding; results are consumed in the seeded order
+                while len(pending) < self.readers:
+                    shard = next(remaining, None)
+                    if shard is None:
+                        break
+                    pending.append((shard[0], shard[1], executor.submit(read_shard, shard[0])))
+                if not pending:
+                    return
+                path, expected_rows, future = pending.popleft()
+                rows = future.result()
+                if len(rows) != expected_rows:
+                    print(f"Warning: {path} has {len(rows)} rows, manifest says {expected_rows}")
+                yield from rows
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def iter_samples(self, epoch: int = 0) -> Iterator[Dict[str, Any]]:
+        """Samples in a seeded, approximately shuffled order"""
+        rng = random.Random(f"{self.seed}:{epoch}")
+        buffer: List[Dict[str, Any]] = []
+        produced = 0
+        for row in self._iter_shard_rows(rng):
+            if self.max_samples is not None and produced >= self.max_samples:
+                return
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(row)
+                continue
+            # Emit a random buffered sample and keep the new one in its place
+            index = rng.randrange(len(buffer))
+            buffer[index], row = row, buffer[index]
+            produced += 1
+            yield row
+        rng.shuffle(buffer)
+        for row in buffer:
+            if self.max_samples is not None and produced >= self.max_samples:
+                return
+            produced += 1
+            yield row
+
+    def iter_batches(self, epoch: int = 0) -> Iterator[List[Dict[str, Any]]]:
+        """Batches of batch_size samples; the last one may be smaller"""
+        batch: List[Dict[str, Any]] = []
+        for sample in self.iter_samples(epoch):
+            batch.append(sample)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        return self.iter_batches()
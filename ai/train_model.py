@@ -2,39 +2,41 @@
 import os
 import json
 from datetime import datetime
+from config import MODEL_CONFIG
+from data_loader import StreamingDataLoader, find_datasets
 
 class ModelTrainer:
     def __init__(self, model_path="./ai/models/qwen3_finetuned"):
         self.model_path = model_path
-        self.training_data_path = "./ai/training_data"
+        # Resolved against backend/ like the writer's setting, so both sides agree on the directory
+        self.training_data_path = os.path.normpath(os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend",
+            os.getenv("TRAINING_DATA_DIR") or os.path.join("..", "ai", "training_data")
+        ))
         
         # Create directories if they don't exist
         os.makedirs(model_path, exist_ok=True)
         os.makedirs(self.training_data_path, exist_ok=True)
     
-    def load_training_data(self, sample_size=1000):
+    def load_training_data(self, sample_size=None, split="train", latest_only=False, seed=None):
         """
         Load curated training examples
-        In a real implementation, this would load from a database or file
+        Returns a loader that streams batches from the dataset shards written by the ETL pipeline
         """
-        # This is a mock implementation
-        # In reality, you would load 1000 curated examples
-        training_examples = []
+        dataset_dirs = find_datasets(self.training_data_path)
+        if latest_only:
+            dataset_dirs = dataset_dirs[-1:]
+        if not dataset_dirs:
+            print(f"No training datasets found in {self.training_data_path}")
         
-        for i in range(min(sample_size, 1000)):
-            example = {
-                "input": f"Sample input {i}",
-                "output": f"Professional prompt for sample {i}"
-            }
-            training_examples.append(example)
-            
-        return training_examples
+        return StreamingDataLoader(dataset_dirs, split=split, seed=seed, max_samples=sample_size)
     
     def fine_tune_model(self, training_data):
         """
         Fine-tune the Qwen 3 model with training data
         """
-        print(f"Fine-tuning model with {len(training_data)} examples...")
+        print(f"Fine-tuning model with {len(training_data)} examples "
+              f"in batches of {training_data.batch_size}...")
         
         # In a real implementation, this would:
         # 1. Load the base Qwen 3 model
@@ -46,12 +48,18 @@ class ModelTrainer:
         print("Loading base model...")
         print("Preparing training data...")
         print("Starting fine-tuning process...")
+        samples = 0
+        for epoch in range(MODEL_CONFIG["fine_tuned_model"]["epochs"]):
+            for batch in training_data.iter_batches(epoch):
+                # A real implementation would run a training step on each batch
+                samples += len(batch)
         print("Saving checkpoint...")
         
         # Save training metadata
         metadata = {
             "training_date": datetime.now().isoformat(),
             "samples": len(training_data),
+            "samples_seen": samples,
             "model_version": "qwen3_finetuned_v1"
         }
         
@@ -61,14 +69,14 @@ class ModelTrainer:
         print(f"Model fine-tuning completed. Checkpoint saved to {self.model_path}")
         return True
     
-    def weekly_incremental_training(self, new_samples=200):
+    def weekly_incremental_training(self, new_samples=MODEL_CONFIG["training"]["weekly_samples"]):
         """
         Perform weekly incremental fine-tuning
         """
         print(f"Performing weekly incremental training with {new_samples} new samples...")
         
         # Load new samples
-        new_data = self.load_training_data(new_samples)
+        new_data = self.load_training_data(new_samples, latest_only=True)
         
         # Fine-tune with new data
         success = self.fine_tune_model(new_data)
@@ -85,7 +93,7 @@ if __name__ == "__main__":
     
     # Initial training with 1000 samples
     print("Starting initial model training...")
-    training_data = trainer.load_training_data(1000)
+    training_data = trainer.load_training_data(MODEL_CONFIG["training"]["initial_samples"])
     trainer.fine_tune_model(training_data)
     
     print("AI model training setup complete!")
\ No newline at end of file
@@ -1,74 +1,334 @@
 # LangChain Integration with Qwen 3 Model
-from typing import Any, TypeVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+import asyncio
 import os
+import queue
+import threading
 
 # Type variables for better type hinting
 T = TypeVar('T')
 
+PROMPT_TEMPLATE = """
+                    Convert the following user input into a professional, structured prompt suitable for {target_tool}.
+                    The prompt should be in {language} language.
+
+                    User Input: {input_text}
+
+                    Structured Prompt:
+                    """
+
+def fallback_prompt(input_text: str, target_tool: str = "general", language: str = "English") -> str:
+    """Prompt returned when the LLM call fails"""
+    return f"Professional prompt for '{input_text}' targeting {target_tool} in {language}"
+
+@lru_cache(maxsize=None)
+def _load_langchain_classes() -> Tuple[Any, Any, Any]:
+    """Resolve the LangChain classes once per process"""
+    # Dynamically import LangChain components to avoid static analysis issues
+    llm_module = __import__('langchain_community.llms', fromlist=['HuggingFaceEndpoint'])
+    prompts_module = __import__('langchain.prompts', fromlist=['PromptTemplate'])
+    chains_module = __import__('langchain.chains', fromlist=['LLMChain'])
+    return (
+        getattr(llm_module, 'HuggingFaceEndpoint'),
+        getattr(prompts_module, 'PromptTemplate'),
+        getattr(chains_module, 'LLMChain'),
+    )
+
+def build_llm() -> Any | None:
+    """Create the Hugging Face endpoint client, or None when no token is configured"""
+    # Note: This requires HUGGINGFACEHUB_API_TOKEN environment variable
+    api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+    if not api_token:
+        return None
+
+    try:
+        HuggingFaceEndpointClass, _, _ = _load_langchain_classes()
+        return HuggingFaceEndpointClass(
+            repo_id="Qwen/Qwen2-7B",
+            huggingfacehub_api_token=api_token,
+            model_kwargs={"temperature": 0.7, "max_length": 2048}
+        )
+    except (ImportError, AttributeError) as e:
+        print(f"LangChain components not available or misconfigured: {e}")
+    except Exception as e:
+        print(f"Error initializing LangChain components: {e}")
+    return None
+
 class PromptOrchestrator:
-    def __init__(self):
-        # Initialize the Qwen 3 model from Hugging Face
-        # Note: This requires HUGGINGFACEHUB_API_TOKEN environment variable
-        self.llm: Any | None = None
+    def __init__(self, llm: Any | None = None, max_consecutive_failures: int = 3):
+        # Initialize the Qwen 3 model from Hugging Face, unless a shared client is given
+        self.llm: Any | None = llm if llm is not None else build_llm()
         self.prompt_template: Any | None = None
         self.chain: Any | None = None
-        
-        api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
-        
-        if api_token:
+
+        # Health tracking used by OrchestratorPool
+        self.max_consecutive_failures = max_consecutive_failures
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+
+        if self.llm is not None:
             try:
-                # Dynamically import LangChain components to avoid static analysis issues
-                llm_module = __import__('langchain_community.llms', fromlist=['HuggingFaceEndpoint'])
-                HuggingFaceEndpointClass = getattr(llm_module, 'HuggingFaceEndpoint')
-                
-                self.llm = HuggingFaceEndpointClass(
-                    repo_id="Qwen/Qwen2-7B",
-                    huggingfacehub_api_token=api_token,
-                    model_kwargs={"temperature": 0.7, "max_length": 2048}
-                )
-                
+                _, PromptTemplateClass, LLMChainClass = _load_langchain_classes()
+
                 # Define prompt template
-                prompts_module = __import__('langchain.prompts', fromlist=['PromptTemplate'])
-                PromptTemplateClass = getattr(prompts_module, 'PromptTemplate')
-                
                 self.prompt_template = PromptTemplateClass(
                     input_variables=["input_text", "target_tool", "language"],
-                    template="""
-                    Convert the following user input into a professional, structured prompt suitable for {target_tool}.
-                    The prompt should be in {language} language.
-                    
-                    User Input: {input_text}
-                    
-                    Structured Prompt:
-                    """
+                    template=PROMPT_TEMPLATE
                 )
-                
+
                 # Create chain
-                chains_module = __import__('langchain.chains', fromlist=['LLMChain'])
-                LLMChainClass = getattr(chains_module, 'LLMChain')
-                
                 self.chain = LLMChainClass(llm=self.llm, prompt=self.prompt_template)
             except (ImportError, AttributeError) as e:
                 print(f"LangChain components not available or misconfigured: {e}")
             except Exception as e:
                 print(f"Error initializing LangChain components: {e}")
-    
-    def generate_prompt(self, input_text: str, target_tool: str = "general", language: str = "English") -> str:
+
+    @property
+    def is_healthy(self) -> bool:
+        """Whether the instance is still fit to serve requests"""
+        return self.consecutive_failures < self.max_consecutive_failures
+
+    def generate_prompt(self, input_text: str, target_tool: str = "general", language: str = "English",
+                        raise_on_error: bool = False) -> str:
         """
         Generate a structured prompt from user input
         """
+        self.total_requests += 1
+
         # If we don't have a real LLM, return a mock response
         if not self.llm or not self.chain:
             return f"Professional prompt for '{input_text}' targeting {target_tool} in {language} (mock response)"
-        
+
         try:
             response: str = self.chain.run(
                 input_text=input_text,
                 target_tool=target_tool,
                 language=language
             )
+            self.consecutive_failures = 0
             return response
         except Exception as e:
             print(f"Error generating prompt: {e}")
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if raise_on_error:
+                raise
             # Return a fallback response
-            return f"Professional prompt for '{input_text}' targeting {target_tool} in {language}"
\ No newline at end of file
+            return fallback_prompt(input_text, target_tool, language)
+
+    def generate_prompts(self, requests: List[Tuple[str, str, str]], raise_on_error: bool = False) -> List[str]:
+        """
+        Generate structured prompts for several (input_text, target_tool, language) requests in one LLM call
+        """
+        self.total_requests += len(requests)
+
+        # If we don't have a real LLM, return mock responses
+        if not self.llm or not self.chain or not self.prompt_template:
+            return [
+                f"Professional prompt for '{input_text}' targeting {target_tool} in {language} (mock response)"
+                for input_text, target_tool, language in requests
+            ]
+
+        try:
+            prompts = [
+                self.prompt_template.format(input_text=input_text, target_tool=target_tool, language=language)
+                for input_text, target_tool, language in requests
+            ]
+            responses: List[str] = self.llm.batch(prompts)
+            self.consecutive_failures = 0
+            return responses
+        except Exception as e:
+            print(f"Error generating prompt batch: {e}")
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if raise_on_error:
+                raise
+            return [fallback_prompt(*request) for request in requests]
+
+    def stream_prompt(self, input_text: str, target_tool: str = "general", language: str = "English") -> Iterator[str]:
+        """
+        Generate a structured prompt token by token as the LLM produces it
+        """
+        self.total_requests += 1
+
+        # If we don't have a real LLM, stream the mock response word by word
+        if not self.llm or not self.chain or not self.prompt_template:
+            words = f"Professional prompt for '{input_text}' targeting {target_tool} in {language} (mock response)".split(" ")
+            for index, word in enumerate(words):
+                yield word if index == len(words) - 1 else word + " "
+            return
+
+        streamed_any = False
+        try:
+            prompt = self.prompt_template.format(
+                input_text=input_text,
+                target_tool=target_tool,
+                language=language
+            )
+            for chunk in self.llm.stream(prompt):
+                streamed_any = True
+                yield chunk
+            self.consecutive_failures = 0
+        except Exception as e:
+            print(f"Error streaming prompt: {e}")
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            # Return a fallback response if nothing was sent yet; a partial prompt cannot be completed
+            if streamed_any:
+                raise
+            yield fallback_prompt(input_text, target_tool, language)
+
+class OrchestratorPool:
+    """Fixed-size pool of PromptOrchestrator instances shared by all requests"""
+
+    def __init__(self, size: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 max_consecutive_failures: int = 3):
+        self.size = size or int(os.getenv("ORCHESTRATOR_POOL_SIZE", "4"))
+        self.max_concurrency = max_concurrency or int(os.getenv("GENERATION_MAX_CONCURRENCY", str(self.size)))
+        self.max_consecutive_failures = max_consecutive_failures
+        self.replacements = 0
+
+        # Bounded worker threads that run the blocking chain calls
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="generation"
+        )
+
+        # One endpoint client for the whole pool so HTTP connections are reused
+        self._llm = build_llm()
+        self._lock = threading.Lock()
+        self._instances: List[PromptOrchestrator] = [
+            PromptOrchestrator(llm=self._llm, max_consecutive_failures=max_consecutive_failures)
+            for _ in range(self.size)
+        ]
+        self._available: "queue.Queue[PromptOrchestrator]" = queue.Queue()
+        for orchestrator in self._instances:
+            self._available.put(orchestrator)
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[PromptOrchestrator]:
+        """Borrow an orchestrator, replacing it on return if it became unhealthy"""
+        orchestrator = self._available.get(timeout=timeout)
+        try:
+            yield orchestrator
+        finally:
+            if not orchestrator.is_healthy:
+                orchestrator = self._replace(orchestrator)
+            self._available.put(orchestrator)
+
+    def _replace(self, orchestrator: PromptOrchestrator) -> PromptOrchestrator:
+        """Swap an unhealthy instance for one with a fresh endpoint client"""
+        replacement = PromptOrchestrator(max_consecutive_failures=self.max_consecutive_failures)
+        with self._lock:
+            index = self._instances.index(orchestrator)
+            self._instances[index] = replacement
+            self.replacements += 1
+        print(f"Replaced unhealthy orchestrator after {orchestrator.consecutive_failures} failures")
+        return replacement
+
+    def generate_prompt(self, input_text: str, target_tool: str = "general", language: str = "English",
+                        raise_on_error: bool = False) -> str:
+        """Generate a structured prompt using a pooled orchestrator"""
+        with self.acquire() as orchestrator:
+            return orchestrator.generate_prompt(
+                input_text=input_text,
+                target_tool=target_tool,
+                language=language,
+                raise_on_error=raise_on_error
+            )
+
+    async def agenerate_prompt(self, input_text: str, target_tool: str = "general", language: str = "English",
+                               raise_on_error: bool = False) -> str:
+        """Generate a structured prompt on the pool's bounded executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(self.generate_prompt, input_text, target_tool, language, raise_on_error)
+        )
+
+    async def agenerate_prompts(self, requests: List[Tuple[str, str, str]], raise_on_error: bool = False) -> List[str]:
+        """Generate a batch of structured prompts with one pooled orchestrator"""
+        def generate_batch() -> List[str]:
+            with self.acquire() as orchestrator:
+                return orchestrator.generate_prompts(requests, raise_on_error=raise_on_error)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, generate_batch)
+
+    async def astream_prompt(self, input_text: str, target_tool: str = "general",
+                             language: str = "English") -> AsyncIterator[str]:
+        """Stream a structured prompt, reading the blocking LLM stream on the pool's executor"""
+        loop = asyncio.get_running_loop()
+        chunks: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce() -> None:
+            try:
+                with self.acquire() as orchestrator:
+                    for chunk in orchestrator.stream_prompt(input_text, target_tool, language):
+                        if cancelled.is_set():
+                            break
+                        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+        producer = loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+            await producer
+        finally:
+            # Stop reading from the LLM if the client went away mid-stream
+            cancelled.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, availability and per-instance health"""
+        with self._lock:
+            instances = [
+                {
+                    "healthy": orchestrator.is_healthy,
+                    "mock": orchestrator.chain is None,
+                    "requests": orchestrator.total_requests,
+                    "failures": orchestrator.total_failures,
+                    "consecutive_failures": orchestrator.consecutive_failures
+                }
+                for orchestrator in self._instances
+            ]
+        return {
+            "size": self.size,
+            "max_concurrency": self.max_concurrency,
+            "available": self._available.qsize(),
+            "replacements": self.replacements,
+            "instances": instances
+        }
+
+    def close(self) -> None:
+        """Release the pooled instances and worker threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._instances.clear()
+        self._llm = None
+
+# Singleton instance
+_orchestrator_pool: Optional[OrchestratorPool] = None
+
+def get_orchestrator_pool() -> OrchestratorPool:
+    """Get the process-wide orchestrator pool, creating it on first use"""
+    global _orchestrator_pool
+    if _orchestrator_pool is None:
+        _orchestrator_pool = OrchestratorPool()
+    return _orchestrator_pool
+
+def close_orchestrator_pool() -> None:
+    """Close the process-wide orchestrator pool"""
+    global _orchestrator_pool
+    if _orchestrator_pool:
+        _orchestrator_pool.close()
+        _orchestrator_pool = None
@@ -1,24 +1,90 @@
-from fastapi import FastAPI, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Any, AsyncIterator, Tuple
+from contextlib import asynccontextmanager
 import uvicorn
+import asyncio
+import json
+import os
 import time
 import uuid
 from datetime import datetime, timezone
+from ai_service import get_orchestrator_pool, close_orchestrator_pool, fallback_prompt
+from response_cache import get_response_cache
+from request_coalescing import SingleFlight
+from micro_batcher import MicroBatcher
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Create shared resources once per worker and release them on shutdown"""
+    global db_service, async_db_service, interaction_spool, interaction_logger, curation_jobs
+    get_orchestrator_pool()
+
+    # Initialize storage backend (Supabase by default, SQLite with STORAGE_BACKEND=sqlite)
+    db_service = create_storage_backend()
+    # Request handlers await the database over a pooled async client instead of blocking the event loop
+    async_db_service = create_async_storage_backend(db_service)
+    await async_db_service.connect()
+
+    # Interactions are bulk-inserted by a background flusher instead of one insert per request;
+    # anything the database cannot take is spooled to disk and replayed later
+    interaction_spool = InteractionSpool()
+    interaction_logger = BatchedInteractionLogger(db_service, spool=interaction_spool)
+    interaction_logger.start()
+    interaction_spool.start_replay(db_service)
+
+    # Curation is incremental: each run only reads interactions past the stored watermark
+    curation_jobs = CurationJobManager(TrainingDataCurator(db_service))
+    start_scheduler(db_service)
+    yield
+    stop_scheduler()
+    # Flush queued interactions before the worker exits
+    interaction_logger.stop()
+    interaction_spool.close()
+    await async_db_service.close()
+    curation_jobs.close()
+    close_orchestrator_pool()
 
 app: FastAPI = FastAPI(
     title="Kalimtak API",
     description="Universal Prompt Orchestrator API with Continuous Learning",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
-# Initialize database service
-from database import SupabaseService
-db_service = SupabaseService()
+from storage import StorageBackend, AsyncStorageBackend, InvalidCursor, create_storage_backend, create_async_storage_backend
+from models import UserInteraction
+from model_training import get_active_model_version
+from interaction_logger import BatchedInteractionLogger
+from interaction_spool import InteractionSpool
+from curation import TrainingDataCurator
+from curation_jobs import CurationJobManager
+from scheduler import start_scheduler, stop_scheduler
+
+# Created in lifespan, not at import: spawned ETL worker processes re-import the launching
+# script, and must not open storage, replay the spool or start their own scheduler
+db_service: StorageBackend
+async_db_service: AsyncStorageBackend
+interaction_spool: InteractionSpool
+interaction_logger: BatchedInteractionLogger
+curation_jobs: CurationJobManager
+
+# Identical concurrent generations share one upstream call
+generation_flights = SingleFlight()
+GENERATION_TIMEOUT_SECONDS = float(os.getenv("GENERATION_TIMEOUT_SECONDS", "30"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "16"))
 
-# Initialize and start scheduler
-from scheduler import start_scheduler
-start_scheduler(db_service)
+# Distinct generations arriving close together are sent upstream as one batch
+async def generate_batch(requests: List[Tuple[str, str, str]]) -> List[str]:
+    return await get_orchestrator_pool().agenerate_prompts(requests, raise_on_error=True)
+
+generation_batcher: MicroBatcher[Tuple[str, str, str], str] = MicroBatcher(
+    generate_batch,
+    max_batch_size=int(os.getenv("GENERATION_BATCH_MAX_SIZE", "8")),
+    window_ms=float(os.getenv("GENERATION_BATCH_WINDOW_MS", "0"))
+)
 
 class PromptRequest(BaseModel):
     text: str
@@ -40,23 +106,98 @@ class HistoryItem(BaseModel):
     tokens: int
     timestamp: str
 
+class BatchPromptRequest(BaseModel):
+    items: List[PromptRequest]
+
+class BatchPromptItemResult(BaseModel):
+    index: int
+    status: str  # success or error
+    result: Optional[PromptResponse] = None
+    error: Optional[str] = None
+
+class BatchPromptResponse(BaseModel):
+    results: List[BatchPromptItemResult]
+    succeeded: int
+    failed: int
+
 # New models for continuous learning
 class FeedbackRequest(BaseModel):
     interaction_id: str
     score: int  # 1-5 scale
     feedback_text: Optional[str] = None
 
-# Mock data for demonstration
-mock_history: List[HistoryItem] = []
-
 @app.get("/")
 async def root() -> dict[str, str]:
     return {"message": "Kalimtak API is running"}
 
+def build_interaction(
+    request: PromptRequest,
+    http_request: Request,
+    structured_prompt: str,
+    model_output: str,
+    tokens_output: int,
+    processing_time: int,
+    interaction_id: Optional[str] = None,
+    cache_hit: bool = False
+) -> UserInteraction:
+    """Create the interaction record logged for continuous learning"""
+    # Get client info
+    client_ip = http_request.client.host if http_request.client else None
+    user_agent = http_request.headers.get("user-agent", "")
+    tokens_input = len(request.text.split())
+
+    return UserInteraction(
+        id=interaction_id or str(uuid.uuid4()),
+        user_id=request.user_id,
+        input_text=request.text,
+        structured_prompt=structured_prompt,
+        model_output=model_output,
+        tokens_input=tokens_input,
+        tokens_output=tokens_output,
+        tokens_total=tokens_input + tokens_output,
+        processing_time_ms=processing_time,
+        model_version=get_active_model_version(),
+        target_tool=request.target_tool,
+        language=request.language,
+        ip_address=client_ip,
+        user_agent=user_agent,
+        cache_hit=cache_hit,
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc)
+    )
+
+def simulated_model_output(request: PromptRequest) -> str:
+    """Placeholder for the downstream model response"""
+    return f"This is a simulated response for the prompt: {request.text[:50]}..."
+
+async def generate_structured_prompt(request: PromptRequest) -> Tuple[str, bool]:
+    """Generate a structured prompt, serving repeated requests from the response cache"""
+    cache = get_response_cache()
+    cache_key = cache.make_key(request.text, request.target_tool, request.language, get_active_model_version())
+    cached_prompt = cache.get(cache_key)
+    if cached_prompt is not None:
+        return cached_prompt, True
+
+    async def generate() -> str:
+        structured_prompt = await generation_batcher.submit(
+            (request.text, request.target_tool, request.language)
+        )
+        cache.set(cache_key, structured_prompt)
+        return structured_prompt
+
+    try:
+        structured_prompt = await generation_flights.do(cache_key, generate, timeout=GENERATION_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Prompt generation timed out")
+    except Exception:
+        # Failed generations fall back to a generic prompt and are never cached
+        return fallback_prompt(request.text, request.target_tool, request.language), False
+
+    return structured_prompt, False
+
 @app.post("/api/generate", response_model=PromptResponse)
 async def generate_prompt(
     request: PromptRequest, 
-    background_tasks: BackgroundTasks,
     http_request: Request
 ) -> PromptResponse:
     """
@@ -64,47 +205,22 @@ async def generate_prompt(
     """
     start_time = time.time()
     
-    # Get client info
-    client_ip = http_request.client.host if http_request.client else None
-    user_agent = http_request.headers.get("user-agent", "")
-    
-    # Generate response
-    from ai_service import PromptOrchestrator
-    orchestrator = PromptOrchestrator()
-    structured_prompt = orchestrator.generate_prompt(
-        input_text=request.text,
-        target_tool=request.target_tool,
-        language=request.language
-    )
+    # Generate response with a pooled orchestrator off the event loop
+    structured_prompt, cache_hit = await generate_structured_prompt(request)
     
-    model_output = f"This is a simulated response for the prompt: {request.text[:50]}..."
+    model_output = simulated_model_output(request)
     
     processing_time = int((time.time() - start_time) * 1000)
     tokens_used = len(structured_prompt.split())
     
     # Create interaction record for logging
-    from models import UserInteraction
-    interaction = UserInteraction(
-        id=str(uuid.uuid4()),
-        user_id=request.user_id,
-        input_text=request.text,
-        structured_prompt=structured_prompt,
-        model_output=model_output,
-        tokens_input=len(request.text.split()),
-        tokens_output=tokens_used,
-        tokens_total=len(request.text.split()) + tokens_used,
-        processing_time_ms=processing_time,
-        model_version="mock-v1.0",  # Would be dynamic in real implementation
-        target_tool=request.target_tool,
-        language=request.language,
-        ip_address=client_ip,
-        user_agent=user_agent,
-        created_at=datetime.now(timezone.utc),
-        updated_at=datetime.now(timezone.utc)
+    interaction = build_interaction(
+        request, http_request, structured_prompt, model_output, tokens_used, processing_time,
+        cache_hit=cache_hit
     )
     
-    # Log interaction asynchronously in background
-    background_tasks.add_task(db_service.log_user_interaction, interaction)
+    # Queue interaction for the write-behind logger
+    interaction_logger.submit(interaction)
     
     return PromptResponse(
         structured_prompt=structured_prompt,
@@ -112,20 +228,162 @@ async def generate_prompt(
         tokens_used=tokens_used
     )
 
+@app.post("/api/generate/stream")
+async def generate_prompt_stream(request: PromptRequest, http_request: Request) -> StreamingResponse:
+    """
+    Stream a structured prompt as server-sent events while the LLM produces it
+    """
+    start_time = time.time()
+    interaction_id = str(uuid.uuid4())
+
+    cache = get_response_cache()
+    cached_prompt = cache.get(
+        cache.make_key(request.text, request.target_tool, request.language, get_active_model_version())
+    )
+
+    async def cached_stream() -> AsyncIterator[str]:
+        if cached_prompt is not None:
+            yield cached_prompt
+
+    async def event_stream() -> AsyncIterator[str]:
+        chunks: List[str] = []
+        time_to_first_token: Optional[int] = None
+
+        # A cached prompt is sent as a single chunk
+        source = cached_stream() if cached_prompt is not None else get_orchestrator_pool().astream_prompt(
+            input_text=request.text,
+            target_tool=request.target_tool,
+            language=request.language
+        )
+        try:
+            async for chunk in source:
+                if time_to_first_token is None:
+                    time_to_first_token = int((time.time() - start_time) * 1000)
+                chunks.append(chunk)
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+        except Exception as e:
+            # The prompt sent so far is incomplete, so it is neither reported as done nor logged
+            print(f"Error streaming prompt: {e}")
+            yield "event: error\ndata: " + json.dumps({
+                "error": "Prompt generation failed",
+                "interaction_id": interaction_id
+            }) + "\n\n"
+            return
+
+        structured_prompt = "".join(chunks)
+        processing_time = int((time.time() - start_time) * 1000)
+        # Counted like /api/generate, whatever the chunking
+        tokens_used = len(structured_prompt.split())
+        yield "data: " + json.dumps({
+            "done": True,
+            "interaction_id": interaction_id,
+            "tokens_used": tokens_used,
+            "time_to_first_token_ms": time_to_first_token,
+            "processing_time_ms": processing_time,
+            "cached": cached_prompt is not None
+        }) + "\n\n"
+
+        # Log the completed interaction once the client has the full prompt
+        interaction = build_interaction(
+            request, http_request, structured_prompt, simulated_model_output(request),
+            tokens_used, processing_time, interaction_id=interaction_id,
+            cache_hit=cached_prompt is not None
+        )
+        interaction_logger.submit(interaction)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/generate/batch", response_model=BatchPromptResponse)
+async def generate_prompt_batch(
+    batch: BatchPromptRequest,
+    http_request: Request
+) -> BatchPromptResponse:
+    """
+    Generate structured prompts for many inputs with bounded parallelism
+    """
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_PARALLELISM)
+    interactions: List[UserInteraction] = []
+
+    async def run_item(index: int, request: PromptRequest) -> BatchPromptItemResult:
+        async with semaphore:
+            start_time = time.time()
+            try:
+                structured_prompt, cache_hit = await generate_structured_prompt(request)
+            except HTTPException as e:
+                return BatchPromptItemResult(index=index, status="error", error=str(e.detail))
+
+            model_output = simulated_model_output(request)
+            processing_time = int((time.time() - start_time) * 1000)
+            tokens_used = len(structured_prompt.split())
+            interactions.append(build_interaction(
+                request, http_request, structured_prompt, model_output, tokens_used, processing_time,
+                cache_hit=cache_hit
+            ))
+            return BatchPromptItemResult(
+                index=index,
+                status="success",
+                result=PromptResponse(
+                    structured_prompt=structured_prompt,
+                    model_output=model_output,
+                    tokens_used=tokens_used
+                )
+            )
+
+    results = await asyncio.gather(*[run_item(index, item) for index, item in enumerate(batch.items)])
+
+    # Queue every interaction of the batch for the write-behind logger
+    interaction_logger.submit_many(interactions)
+
+    succeeded = sum(1 for result in results if result.status == "success")
+    return BatchPromptResponse(
+        results=list(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded
+    )
+
 @app.get("/api/history/{user_id}", response_model=List[HistoryItem])
-async def get_history(user_id: str) -> List[HistoryItem]:
+async def get_history(
+    user_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
+) -> List[HistoryItem]:
     """
-    Get prompt history for a user
+    Get one page of prompt history for a user, newest first.
+    The cursor for the next page is returned in the X-Next-Cursor header.
     """
-    # Filter mock history by user_id
-    user_history: List[HistoryItem] = [item for item in mock_history if item.user_id == user_id]
-    return user_history
+    try:
+        rows, next_cursor = await async_db_service.get_user_history(user_id, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return [
+        HistoryItem(
+            id=str(row["id"]),
+            user_id=str(row["user_id"]),
+            input_text=row.get("input_text") or "",
+            structured_prompt=row.get("structured_prompt") or "",
+            output=row.get("model_output") or "",
+            tokens=row.get("tokens_total") or 0,
+            timestamp=str(row["created_at"])
+        )
+        for row in rows
+    ]
 
 @app.post("/api/feedback")
 async def submit_feedback(feedback: FeedbackRequest) -> dict[str, str]:
     """Submit feedback for a specific interaction"""
     try:
-        success = db_service.update_interaction_feedback(
+        success = await async_db_service.update_interaction_feedback(
             interaction_id=feedback.interaction_id,
             score=feedback.score,
             feedback_text=feedback.feedback_text
@@ -138,59 +396,42 @@ async def submit_feedback(feedback: FeedbackRequest) -> dict[str, str]:
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-@app.post("/api/admin/curate-training-data")
+@app.get("/api/admin/metrics")
+async def get_metrics() -> dict[str, Any]:
+    """Runtime metrics for the generation path"""
+    return {
+        "orchestrator_pool": get_orchestrator_pool().stats(),
+        "response_cache": get_response_cache().stats(),
+        "request_coalescing": generation_flights.stats(),
+        "micro_batching": generation_batcher.stats(),
+        "interaction_logger": interaction_logger.stats(),
+        "interaction_spool": interaction_spool.stats()
+    }
+
+@app.post("/api/admin/curate-training-data", status_code=202)
 async def curate_training_data() -> dict[str, str]:
-    """Admin endpoint to curate high-quality interactions for training"""
-    try:
-        # Get high-quality interactions
-        candidates = db_service.get_training_data_candidates(limit=1000)
-        
-        curated_count = 0
-        for interaction in candidates:
-            # Safely extract values from the interaction dictionary
-            interaction_id = str(interaction.get("id", ""))
-            input_text = str(interaction.get("input_text", ""))
-            structured_prompt = str(interaction.get("structured_prompt", ""))
-            
-            # Extract and convert feedback_score
-            feedback_score_raw = interaction.get("feedback_score", 0)
-            try:
-                feedback_score = float(feedback_score_raw) if feedback_score_raw else 0.0
-                quality_score = feedback_score / 5.0  # Normalize to 0-1
-            except (ValueError, TypeError):
-                quality_score = 0.0
-            
-            target_tool = str(interaction.get("target_tool", "general"))
-            
-            # Create training data item
-            from models import TrainingDataItem
-            training_data_item = TrainingDataItem(
-                id=str(uuid.uuid4()),
-                source_interaction_id=interaction_id,
-                input_prompt=input_text,
-                target_output=structured_prompt,
-                quality_score=quality_score,
-                domain_category="general",  # Would be classified by ML
-                use_case=target_tool,
-                is_curated=True,
-                is_selected=False,  # Will be selected by filtering algorithm
-                created_at=datetime.now(timezone.utc)
-            )
-            
-            if db_service.save_training_data_item(training_data_item):
-                curated_count += 1
-        
-        return {
-            "status": "success", 
-            "message": f"Curated {curated_count} training data items"
-        }
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    """
+    Admin endpoint to curate interactions created or re-scored since the last run.
+    The run happens in the background; poll the job status endpoint for progress.
+    """
+    job = curation_jobs.submit()
+    return {
+        "status": "accepted",
+        "message": "Curation job accepted",
+        "job_id": job.job_id
+    }
+
+@app.get("/api/admin/curation-jobs/{job_id}")
+async def get_curation_job(job_id: str) -> dict[str, Any]:
+    """Progress and throughput of a curation job"""
+    job = curation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Curation job not found")
+    return job.to_dict()
 
 if __name__ == "__main__":
     try:
         uvicorn.run("app:app", host="0.0.0.0", port=8001, reload=True)
     except KeyboardInterrupt:
         # Stop the scheduler when the app is shut down
-        from scheduler import stop_scheduler
         stop_scheduler()
\ No newline at end of file
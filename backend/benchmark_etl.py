@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark for Kalimtak ETL transforms
+Times the row transform on synthetic interactions, measures content filter throughput,
+then how the full streaming pipeline scales across 1..max_workers processes.
+
+Usage: python benchmark_etl.py [rows] [max_samples_per_domain] [max_workers]
+"""
+
+import sys
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from etl_pipeline import DataETLPipeline
+from near_duplicates import NearDuplicateDetector
+from content_filter import get_content_filter
+from sqlite_storage import SQLiteStorage
+
+DOMAINS = ["general", "chatgpt", "midjourney", "claude", "gemini", "copilot", "dalle", "stable-diffusion"]
+LANGUAGES = ["en", "ar", "fr", "es"]
+
+def make_interactions(rows: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Synthetic candidate interactions with a skewed domain mix"""
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"interaction-{i}",
+            "input_text": f"Write about topic {rng.randrange(rows)}",
+            "structured_prompt": f"Structured prompt {i}",
+            "feedback_score": rng.randint(1, 5),
+            "target_tool": DOMAINS[min(int(rng.expovariate(0.6)), len(DOMAINS) - 1)],
+            "language": rng.choice(LANGUAGES)
+        }
+        for i in range(rows)
+    ]
+
+def transform_path(interactions: List[Dict[str, Any]]) -> Dict[str, int]:
+    samples = DataETLPipeline.iter_transform_for_training(interactions)
+    counts: Dict[str, int] = {}
+    for sample in samples:
+        domain = sample["metadata"]["domain"]
+        counts[domain] = counts.get(domain, 0) + 1
+    return counts
+
+def pipeline_path(interactions: List[Dict[str, Any]], max_samples_per_domain: int, workers: int) -> Dict[str, int]:
+    pipeline = DataETLPipeline(SQLiteStorage(path=":memory:"))
+    samples = pipeline.stream_training_samples(
+        interactions, max_samples_per_domain, near_duplicates=NearDuplicateDetector(), workers=workers
+    )
+    for _ in samples:
+        pass
+    return pipeline.stage_counts
+
+def timed(fn: Callable[..., Dict[str, int]], *args: Any, repeats: int = 3) -> tuple[float, Dict[str, int]]:
+    """Best wall time in seconds over a few runs"""
+    best = float("inf")
+    result: Dict[str, int] = {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def content_filter_throughput(interactions: List[Dict[str, Any]]) -> None:
+    """Blocklist scan speed over the input and output text of every interaction"""
+    content_filter = get_content_filter()
+    texts = [(row["input_text"], row["structured_prompt"]) for row in interactions]
+    megabytes = sum(len(a.encode("utf-8")) + len(b.encode("utf-8")) for a, b in texts) / 1e6
+
+    def scan() -> Dict[str, int]:
+        rejected = sum(1 for a, b in texts if content_filter.check(a, b) is not None)
+        return {"rejected": rejected}
+
+    seconds, result = timed(scan)
+    print(f"\nContent filter ({content_filter.engine}, {len(content_filter.terms)} terms): "
+          f"{megabytes / seconds:.1f} MB/s, {result['rejected']} rejected")
+
+def scaling(interactions: List[Dict[str, Any]], max_samples_per_domain: int, max_workers: int) -> int:
+    """Full pipeline with near-duplicate detection at 1..max_workers processes"""
+    print(f"\nPipeline scaling (1-{max_workers} workers)")
+    baseline_seconds, baseline_counts = timed(pipeline_path, interactions, max_samples_per_domain, 1, repeats=1)
+    for workers in range(1, max_workers + 1):
+        if workers == 1:
+            seconds, counts = baseline_seconds, baseline_counts
+        else:
+            seconds, counts = timed(pipeline_path, interactions, max_samples_per_domain, workers, repeats=1)
+        print(f"{workers:2d} worker(s): {seconds * 1000:9.1f} ms  ({len(interactions) / seconds:,.0f} rows/s, "
+              f"{baseline_seconds / seconds:.1f}x)")
+        if counts != baseline_counts:
+            print(f"❌ Stage counts differ: {baseline_counts} != {counts}")
+            return 1
+    print(f"✓ Stage counts match: {baseline_counts}")
+    return 0
+
+def main() -> int:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    max_samples_per_domain = int(sys.argv[2]) if len(sys.argv) > 2 else rows // 20
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+
+    print("Kalimtak ETL Transform Benchmark")
+    print("=" * 50)
+    interactions = make_interactions(rows)
+    print(f"Rows: {rows}, max samples per domain: {max_samples_per_domain}")
+
+    transform_seconds, transform_counts = timed(transform_path, interactions)
+    print(f"Transform: {transform_seconds * 1000:9.1f} ms  ({rows / transform_seconds:,.0f} rows/s), "
+          f"domains: {transform_counts}")
+
+    content_filter_throughput(interactions)
+    return scaling(interactions, max_samples_per_domain, max_workers)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# Content Filter for Kalimtak Training Data
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from response_cache import normalize_text
+from paths import env_path, resolve_path
+
+# pyahocorasick is a requirement; the trie-shaped regex only covers installs where it is missing,
+# at roughly half its scan speed on long text
+try:
+    ahocorasick: Any = __import__('ahocorasick')
+except ImportError:
+    ahocorasick = None
+
+DEFAULT_BLOCKLIST_DIR = resolve_path("blocklists")
+
+class FilterMatch(NamedTuple):
+    """Why a text was rejected: the blocklist it matched (the reason code) and the term"""
+    reason: str
+    term: str
+
+def load_blocklists(blocklist_dir: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Read every <reason>.txt in a directory; a missing directory gives no terms.
+    Returns (normalized term -> reason code, reason code -> declared version).
+    """
+    terms: Dict[str, str] = {}
+    versions: Dict[str, str] = {}
+    if not os.path.isdir(blocklist_dir):
+        print(f"Error loading blocklists: {blocklist_dir} is not a directory, filtering nothing")
+        return terms, versions
+    for filename in sorted(os.listdir(blocklist_dir)):
+        if not filename.endswith(".txt"):
+            continue
+        reason = filename[:-len(".txt")]
+        versions[reason] = "0"
+        with open(os.path.join(blocklist_dir, filename), encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("#"):
+                    if line[1:].strip().startswith("version:"):
+                        versions[reason] = line.split(":", 1)[1].strip()
+                    continue
+                term = normalize_text(line)
+                if term:
+                    # A term listed twice keeps the first reason code
+                    terms.setdefault(term, reason)
+    return terms, versions
+
+def _trie_pattern(terms: List[str]) -> str:
+    """Regex alternation shaped like a trie, so the engine never retries a shared prefix"""
+    trie: Dict[str, Any] = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+class ContentFilter:
+    """
+    Blocklist filter compiled into a single multi-pattern automaton.
+    Text is normalized like cache keys (case and whitespace folded) and scanned once;
+    terms only match whole words. Uses pyahocorasick, falling back to a trie-compiled
+    regex when it is not installed.
+    """
+
+    def __init__(self, blocklist_dir: Optional[str] = None):
+        self.blocklist_dir = blocklist_dir or env_path("CONTENT_BLOCKLIST_DIR", DEFAULT_BLOCKLIST_DIR)
+        self.terms, self.versions = load_blocklists(self.blocklist_dir)
+        self.engine = "aho-corasick" if ahocorasick is not None else "regex"
+
+        if ahocorasick is not None:
+            self._automaton: Any = ahocorasick.Automaton()
+            for term, reason in self.terms.items():
+                self._automaton.add_word(term, FilterMatch(reason, term))
+            if self.terms:
+                self._automaton.make_automaton()
+        elif self.terms:
+            self._pattern: Optional["re.Pattern[str]"] = re.compile(
+                r"(?<!\w)(?:" + _trie_pattern(list(self.terms)) + r")(?!\w)"
+            )
+        else:
+            self._pattern = None
+
+        # Counters reported through stats()
+        self.scanned = 0
+        self.rejected: Dict[str, int] = {}
+
+    @property
+    def version(self) -> str:
+        """Declared blocklist versions plus a digest of the compiled terms"""
+        digest = hashlib.sha256("\n".join(f"{term}\t{reason}" for term, reason in sorted(self.terms.items())).encode("utf-8"))
+        declared = ",".join(f"{reason}:{version}" for reason, version in sorted(self.versions.items()))
+        return f"{declared}@{digest.hexdigest()[:12]}"
+
+    def scan(self, text: str) -> Optional[FilterMatch]:
+        """First blocklisted term in already-normalized text, if any"""
+        if not self.terms:
+            return None
+        if self.engine == "aho-corasick":
+            for end, match in self._automaton.iter(text):
+                start = end - len(match.term) + 1
+                if (start == 0 or not _is_word_char(text[start - 1])) and \
+                   (end + 1 == len(text) or not _is_word_char(text[end + 1])):
+                    return match
+            return None
+        assert self._pattern is not None
+        found = self._pattern.search(text)
+        if found is None:
+            return None
+        term = found.group(0)
+        return FilterMatch(self.terms[term], term)
+
+    def check(self, *texts: str) -> Optional[FilterMatch]:
+        """Scan several texts in a single pass; newlines keep terms from spanning two texts"""
+        self.scanned += 1
+        match = self.scan("\n".join(normalize_text(text) for text in texts))
+        if match is not None:
+            self.rejected[match.reason] = self.rejected.get(match.reason, 0) + 1
+        return match
+
+    def stats(self) -> Dict[str, Any]:
+        """Filter configuration and counters"""
+        return {
+            "engine": self.engine,
+            "version": self.version,
+            "terms": len(self.terms),
+            "scanned": self.scanned,
+            "rejected": dict(self.rejected)
+        }
+
+# Singleton instance
+_content_filter: Optional[ContentFilter] = None
+
+def get_content_filter() -> ContentFilter:
+    """Get the process-wide content filter"""
+    global _content_filter
+    if _content_filter is None:
+        _content_filter = ContentFilter()
+    return _content_filter
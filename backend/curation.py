@@ -0,0 +1,129 @@
+# Incremental Training Data Curation for Kalimtak
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from models import TrainingDataItem
+from storage import StorageBackend, CANDIDATE_PAGE_SIZE, CURATION_PRODUCER, training_data_item_id
+
+# Watermark names for the incremental jobs that read candidates
+CURATION_WATERMARK = "training_data_curation"
+DATASET_WATERMARK = "training_dataset"
+
+# Re-scored interactions move forward in updated_at order, so they are picked up again
+WATERMARK_COLUMN = "updated_at"
+
+_watermark_locks: Dict[str, threading.Lock] = {}
+_watermark_locks_guard = threading.Lock()
+
+def watermark_lock(name: str) -> threading.Lock:
+    """Process-wide lock for a named watermark, shared by every job that advances it"""
+    with _watermark_locks_guard:
+        return _watermark_locks.setdefault(name, threading.Lock())
+
+class CandidateStream:
+    """Iterate candidates changed since a named watermark, remembering how far iteration got"""
+
+    def __init__(self, db_service: StorageBackend, name: str, page_size: Optional[int] = None):
+        self.db_service = db_service
+        self.name = name
+        self.page_size = page_size or CANDIDATE_PAGE_SIZE
+        # Raises if the watermark cannot be read, so a run aborts instead of starting from scratch
+        self.start = db_service.get_watermark(name)
+        self.position = self.start
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in self.db_service.iter_training_data_candidates(
+            page_size=self.page_size, cursor_column=WATERMARK_COLUMN, after=self.start
+        ):
+            self.position = (str(row[WATERMARK_COLUMN]), str(row["id"]))
+            self.count += 1
+            yield row
+
+    def commit(self) -> bool:
+        """Persist the position of the last row handed out"""
+        if self.position is None or self.position == self.start:
+            return True
+        return self.db_service.save_watermark(self.name, *self.position)
+
+def build_training_data_item(interaction: Dict[str, Any]) -> TrainingDataItem:
+    """Turn a candidate interaction into a curated training data item"""
+    # Safely extract values from the interaction dictionary
+    interaction_id = str(interaction.get("id", ""))
+
+    # Extract and convert feedback_score
+    feedback_score_raw = interaction.get("feedback_score", 0)
+    try:
+        feedback_score = float(feedback_score_raw) if feedback_score_raw else 0.0
+        quality_score = feedback_score / 5.0  # Normalize to 0-1
+    except (ValueError, TypeError):
+        quality_score = 0.0
+
+    # Its id is derived from the interaction so re-runs update it
+    return TrainingDataItem(
+        id=training_data_item_id(interaction_id, CURATION_PRODUCER),
+        source_interaction_id=interaction_id,
+        input_prompt=str(interaction.get("input_text", "")),
+        target_output=str(interaction.get("structured_prompt", "")),
+        quality_score=quality_score,
+        domain_category="general",  # Would be classified by ML
+        use_case=str(interaction.get("target_tool", "general")),
+        is_curated=True,
+        is_selected=False,  # Will be selected by filtering algorithm
+        created_at=datetime.now(timezone.utc)
+    )
+
+class TrainingDataCurator:
+    """Curate interactions created or re-scored since the last run"""
+
+    def __init__(self, db_service: StorageBackend, watermark_name: str = CURATION_WATERMARK,
+                 chunk_size: int = 500):
+        self.db_service = db_service
+        self.watermark_name = watermark_name
+        self.chunk_size = chunk_size
+
+    def curate(self, page_size: Optional[int] = None,
+               on_progress: Optional[Callable[[int, int, int], None]] = None) -> int:
+        """
+        Curate new candidates in chunks, advancing the watermark after each saved chunk.
+        on_progress receives (scanned, curated, failed) after every chunk.
+        A run that starts while another holds the same watermark waits, then curates only what is left.
+        """
+        # Scheduled runs and API-submitted jobs use separate curators over the same watermark
+        with watermark_lock(self.watermark_name):
+            return self._curate(page_size, on_progress)
+
+    def _curate(self, page_size: Optional[int],
+                on_progress: Optional[Callable[[int, int, int], None]]) -> int:
+        stream = CandidateStream(self.db_service, self.watermark_name, page_size=page_size)
+        batch: List[TrainingDataItem] = []
+        curated = 0
+        failed = 0
+
+        for interaction in stream:
+            batch.append(build_training_data_item(interaction))
+            if len(batch) >= self.chunk_size:
+                saved, complete = self._save(batch, stream)
+                curated += saved
+                failed += len(batch) - saved
+                batch = []
+                if on_progress:
+                    on_progress(stream.count, curated, failed)
+                if not complete:
+                    return curated
+
+        if batch:
+            saved = self._save(batch, stream)[0]
+            curated += saved
+            failed += len(batch) - saved
+        if on_progress:
+            on_progress(stream.count, curated, failed)
+        return curated
+
+    def _save(self, batch: List[TrainingDataItem], stream: CandidateStream) -> Tuple[int, bool]:
+        """Save one chunk; the watermark only moves past rows that were all written"""
+        saved = self.db_service.save_training_data_items(batch, chunk_size=self.chunk_size)
+        if saved < len(batch):
+            print(f"Curation stopped after {saved} of {len(batch)} items; the next run resumes from the watermark")
+            return saved, False
+        return saved, stream.commit()
@@ -0,0 +1,98 @@
+# Background Curation Jobs for Kalimtak
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from curation import TrainingDataCurator
+
+class CurationJob:
+    """Progress of one curation run"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = "queued"  # queued, running, succeeded, failed
+        self.scanned = 0
+        self.curated = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Job status with elapsed time and throughput"""
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "scanned": self.scanned,
+            "curated": self.curated,
+            "failed": self.failed,
+            "error": self.error,
+            "elapsed_seconds": elapsed,
+            "rows_per_second": self.scanned / elapsed if elapsed > 0 else 0.0
+        }
+
+class CurationJobManager:
+    """Run curation on a dedicated executor so it never occupies request-serving threads"""
+
+    def __init__(self, curator: TrainingDataCurator, max_workers: Optional[int] = None, max_jobs: int = 100):
+        self.curator = curator
+        self.max_jobs = max_jobs
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("CURATION_MAX_WORKERS", "1")),
+            thread_name_prefix="curation"
+        )
+        self._jobs: "OrderedDict[str, CurationJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self) -> CurationJob:
+        """Queue a curation run, or return the one already queued or running"""
+        with self._lock:
+            # Runs share a watermark, so a second concurrent run would only repeat work
+            for job in self._jobs.values():
+                if job.is_active:
+                    return job
+
+            job = CurationJob(str(uuid.uuid4()))
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[CurationJob]:
+        """Look up a job by id"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: CurationJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+
+        def on_progress(scanned: int, curated: int, failed: int) -> None:
+            job.scanned, job.curated, job.failed = scanned, curated, failed
+
+        try:
+            self.curator.curate(on_progress=on_progress)
+            job.status = "failed" if job.failed else "succeeded"
+        except Exception as e:
+            print(f"Error in curation job {job.job_id}: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def close(self) -> None:
+        """Stop accepting jobs and drop any that have not started"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
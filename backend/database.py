@@ -1,154 +1,452 @@
 # Supabase Integration
+import base64
+import json
 import os
-from supabase import create_client, Client
-from typing import List, Optional, Dict, Any, Union
+import httpx
+from supabase import create_client, acreate_client, Client, AsyncClient, AsyncClientOptions
+from postgrest.types import ReturnMethod
+from typing import List, Optional, Dict, Any, Tuple, Union, Iterator, AsyncIterator
 from models import User, Query, Favorite, UserInteraction, TrainingDataItem
-from datetime import datetime
+from storage import StorageBackend, AsyncStorageBackend, CANDIDATE_COLUMNS, CANDIDATE_PAGE_SIZE, InvalidCursor
+from datetime import datetime, timezone
 
 # Type alias for Supabase response data
 SupabaseData = Union[List[Dict[str, Any]], Dict[str, Any], None]
 
-class SupabaseService:
+# Rows per training data upsert request
+TRAINING_DATA_CHUNK_SIZE = int(os.getenv("TRAINING_DATA_UPSERT_CHUNK_SIZE", "500"))
+
+# Columns needed to render a history item
+HISTORY_COLUMNS = "id,user_id,input_text,structured_prompt,model_output,tokens_total,created_at"
+
+def encode_cursor(sort_value: str, row_id: str) -> str:
+    """Encode a keyset pagination position as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by encode_cursor; raises InvalidCursor for anything else"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+    if not (isinstance(position, list) and len(position) == 2 and all(isinstance(value, str) for value in position)):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return position[0], position[1]
+
+# Row conversion and query building shared by the sync and async services
+def _interaction_to_row(interaction: UserInteraction) -> Dict[str, Any]:
+    """Convert an interaction into a user_interactions row"""
+    # Convert datetime objects to ISO format strings
+    created_at_str = interaction.created_at.isoformat() if interaction.created_at else None
+    updated_at_str = interaction.updated_at.isoformat() if interaction.updated_at else None
+
+    interaction_data = {
+        "id": interaction.id,
+        "user_id": interaction.user_id,
+        "session_id": interaction.session_id,
+        "input_text": interaction.input_text,
+        "structured_prompt": interaction.structured_prompt,
+        "model_output": interaction.model_output,
+        "tokens_input": interaction.tokens_input,
+        "tokens_output": interaction.tokens_output,
+        "tokens_total": interaction.tokens_total,
+        "processing_time_ms": interaction.processing_time_ms,
+        "model_version": interaction.model_version,
+        "target_tool": interaction.target_tool,
+        "language": interaction.language,
+        "feedback_score": interaction.feedback_score,
+        "feedback_text": interaction.feedback_text,
+        "ip_address": interaction.ip_address,
+        "user_agent": interaction.user_agent,
+        # Only sent when true, so tables created before the column existed keep accepting inserts
+        "cache_hit": interaction.cache_hit or None,
+        "created_at": created_at_str,
+        "updated_at": updated_at_str
+    }
+
+    # Remove None values
+    return {k: v for k, v in interaction_data.items() if v is not None}
+
+def _training_item_to_row(item: TrainingDataItem) -> Dict[str, Any]:
+    """Convert a curated item into a training_data row"""
+    # Convert datetime objects to ISO format strings
+    created_at_str = item.created_at.isoformat() if item.created_at else None
+
+    item_data = {
+        "id": item.id,
+        "source_interaction_id": item.source_interaction_id,
+        "input_prompt": item.input_prompt,
+        "target_output": item.target_output,
+        "quality_score": item.quality_score,
+        "domain_category": item.domain_category,
+        "use_case": item.use_case,
+        "is_curated": item.is_curated,
+        "is_selected": item.is_selected,
+        "created_at": created_at_str
+    }
+
+    # Remove None values
+    return {k: v for k, v in item_data.items() if v is not None}
+
+def _feedback_update(score: int, feedback_text: Optional[str]) -> Dict[str, Any]:
+    """Build the user_interactions update for a feedback submission"""
+    update_data: Dict[str, Any] = {
+        "feedback_score": score,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+    if feedback_text:
+        update_data["feedback_text"] = feedback_text
+    return update_data
+
+def _history_query(client: Any, user_id: str, limit: int, cursor: Optional[str]) -> Any:
+    """Build one keyset-paginated history page query"""
+    query = client.table("user_interactions")\
+        .select(HISTORY_COLUMNS)\
+        .eq("user_id", user_id)
+
+    # Keyset pagination on (created_at, id) served by the (user_id, created_at, id) index
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{row_id}")'
+        )
+
+    return query\
+        .order("created_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(limit + 1)
+
+def _history_page(data: Any, limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Split a limit + 1 row response into the page and the next cursor"""
+    rows: List[Dict[str, Any]] = list(data or [])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(str(rows[-1]["created_at"]), str(rows[-1]["id"]))
+    return rows, next_cursor
+
+def _candidates_page_query(client: Any, columns: str, page_size: int, cursor_column: str,
+                           after: Optional[Tuple[str, str]]) -> Any:
+    """Build one keyset page of high-quality training candidates, oldest first"""
+    query = client.table("user_interactions")\
+        .select(columns)\
+        .gte("feedback_score", 4)
+
+    if after:
+        value, row_id = after
+        query = query.or_(
+            f'{cursor_column}.gt."{value}",and({cursor_column}.eq."{value}",id.gt."{row_id}")'
+        )
+
+    return query\
+        .order(cursor_column)\
+        .order("id")\
+        .limit(page_size)
+
+class SupabaseService(StorageBackend):
     def __init__(self):
         self.supabase_url = os.getenv("SUPABASE_URL", "")
         self.supabase_key = os.getenv("SUPABASE_KEY", "")
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
-    
+
     # Simplified existing methods (keeping original functionality)
     def get_user(self, user_id: str) -> Optional[User]:
         """Get user by ID"""
         # For now, return None since we're focusing on new functionality
         return None
-    
+
     def get_user_queries(self, user_id: str) -> List[Query]:
         """Get all queries for a user"""
         return []
-    
+
     def save_query(self, query: Query) -> bool:
         """Save a query to the database"""
         return True
-    
+
     def get_favorite_prompts(self, user_id: str) -> List[Favorite]:
         """Get user's favorite prompts"""
         return []
-    
+
     # New methods for continuous learning (focus of implementation)
     def log_user_interaction(self, interaction: UserInteraction) -> bool:
         """Asynchronously log user interaction for learning"""
         try:
-            # Convert datetime objects to ISO format strings
-            created_at_str = interaction.created_at.isoformat() if interaction.created_at else None
-            updated_at_str = interaction.updated_at.isoformat() if interaction.updated_at else None
-            
-            interaction_data = {
-                "id": interaction.id,
-                "user_id": interaction.user_id,
-                "session_id": interaction.session_id,
-                "input_text": interaction.input_text,
-                "structured_prompt": interaction.structured_prompt,
-                "model_output": interaction.model_output,
-                "tokens_input": interaction.tokens_input,
-                "tokens_output": interaction.tokens_output,
-                "tokens_total": interaction.tokens_total,
-                "processing_time_ms": interaction.processing_time_ms,
-                "model_version": interaction.model_version,
-                "target_tool": interaction.target_tool,
-                "language": interaction.language,
-                "feedback_score": interaction.feedback_score,
-                "feedback_text": interaction.feedback_text,
-                "ip_address": interaction.ip_address,
-                "user_agent": interaction.user_agent,
-                "created_at": created_at_str,
-                "updated_at": updated_at_str
-            }
-            
-            # Remove None values
-            interaction_data = {k: v for k, v in interaction_data.items() if v is not None}
-            
+            interaction_data = _interaction_to_row(interaction)
             self.supabase.table("user_interactions").insert(interaction_data).execute()
             return True
         except Exception as e:
             print(f"Error logging interaction: {e}")
             return False
-    
-    def get_training_data_candidates(self, limit: int = 1000) -> List[Dict[str, Any]]:
-        """Retrieve high-quality interactions for training data"""
+
+    def log_user_interactions(self, interactions: List[UserInteraction]) -> bool:
+        """Log several interactions with a single bulk insert"""
+        if not interactions:
+            return True
         try:
-            response = self.supabase.table("user_interactions")\
-                .select("*")\
-                .gte("feedback_score", 4)\
-                .not_.is_("feedback_score", "null")\
-                .limit(limit)\
+            rows = [_interaction_to_row(interaction) for interaction in interactions]
+            # Rows already written by an earlier retry or spool replay are skipped
+            self.supabase.table("user_interactions")\
+                .upsert(rows, on_conflict="id", ignore_duplicates=True, returning=ReturnMethod.minimal)\
                 .execute()
-            
-            # Extract data from response - handle as generic list of dicts
-            result: List[Dict[str, Any]] = []
-            
-            # Check if response has data attribute and it's a list
-            # We'll ignore type checking for these lines as we're handling unknown types
-            if hasattr(response, 'data') and isinstance(response.data, list):  # type: ignore
-                for item in response.data:  # type: ignore
-                    if isinstance(item, dict):
-                        # Create a new dict with only the basic types
-                        clean_item: Dict[str, Any] = {}
-                        for key, value in item.items():  # type: ignore
-                            # Only include basic types to avoid complex type issues
-                            if isinstance(value, (str, int, float, bool)) or value is None:
-                                clean_item[key] = value
-                            elif isinstance(value, (list, dict)):
-                                # Convert complex types to strings for now
-                                clean_item[key] = str(value)  # type: ignore
-                        result.append(clean_item)
-            
-            return result
+            return True
         except Exception as e:
-            print(f"Error fetching training candidates: {e}")
-            return []
-    
+            print(f"Error logging {len(interactions)} interactions: {e}")
+            return False
+
+    def get_user_history(self, user_id: str, limit: int = 50,
+                         cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch one page of a user's interactions, newest first, with the cursor of the next page"""
+        try:
+            response = _history_query(self.supabase, user_id, limit, cursor).execute()
+            return _history_page(response.data, limit)
+        except InvalidCursor:
+            raise
+        except Exception as e:
+            print(f"Error fetching user history: {e}")
+            return [], None
+
+    def iter_training_data_candidates(self, page_size: Optional[int] = None, columns: str = CANDIDATE_COLUMNS,
+                                      cursor_column: str = "created_at",
+                                      after: Optional[Tuple[str, str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield high-quality interactions page by page, ordered by (cursor_column, id) and starting after `after`"""
+        page_size = page_size or CANDIDATE_PAGE_SIZE
+        while True:
+            try:
+                response = _candidates_page_query(self.supabase, columns, page_size, cursor_column, after).execute()
+            except Exception as e:
+                # Stopping quietly would look like the end of the data and let a partial run commit
+                print(f"Error fetching training candidates: {e}")
+                raise
+            rows: List[Dict[str, Any]] = response.data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = (str(rows[-1][cursor_column]), str(rows[-1]["id"]))
+
     def save_training_data_item(self, item: TrainingDataItem) -> bool:
         """Save curated training data item"""
         try:
-            # Convert datetime objects to ISO format strings
-            created_at_str = item.created_at.isoformat() if item.created_at else None
-            
-            item_data = {
-                "id": item.id,
-                "source_interaction_id": item.source_interaction_id,
-                "input_prompt": item.input_prompt,
-                "target_output": item.target_output,
-                "quality_score": item.quality_score,
-                "domain_category": item.domain_category,
-                "use_case": item.use_case,
-                "is_curated": item.is_curated,
-                "is_selected": item.is_selected,
-                "created_at": created_at_str
-            }
-            
-            # Remove None values
-            item_data = {k: v for k, v in item_data.items() if v is not None}
-            
+            item_data = _training_item_to_row(item)
             self.supabase.table("training_data").insert(item_data).execute()
             return True
         except Exception as e:
             print(f"Error saving training data: {e}")
             return False
-    
+
+    def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+        """Upsert curated items in chunks keyed on their id; returns how many were written"""
+        chunk_size = chunk_size or TRAINING_DATA_CHUNK_SIZE
+        saved = 0
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            try:
+                self.supabase.table("training_data")\
+                    .upsert([_training_item_to_row(item) for item in chunk], on_conflict="id",
+                            returning=ReturnMethod.minimal)\
+                    .execute()
+                saved += len(chunk)
+            except Exception as e:
+                print(f"Error saving {len(chunk)} training data items: {e}")
+        return saved
+
     def update_interaction_feedback(self, interaction_id: str, score: int, feedback_text: Optional[str] = None) -> bool:
         """Update an interaction with user feedback"""
         try:
-            update_data = {
-                "feedback_score": score,
-                "updated_at": datetime.now().isoformat()
-            }
-            
-            if feedback_text:
-                update_data["feedback_text"] = feedback_text
-                
             self.supabase.table("user_interactions")\
-                .update(update_data)\
+                .update(_feedback_update(score, feedback_text))\
                 .eq("id", interaction_id)\
                 .execute()
             return True
         except Exception as e:
             print(f"Error updating interaction feedback: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def get_watermark(self, name: str) -> Optional[Tuple[str, str]]:
+        """Get the (cursor value, id) position an incremental job last processed"""
+        try:
+            response = self.supabase.table("etl_watermarks")\
+                .select("cursor_value,cursor_id")\
+                .eq("name", name)\
+                .limit(1)\
+                .execute()
+            rows: List[Dict[str, Any]] = response.data or []
+            if rows:
+                return str(rows[0]["cursor_value"]), str(rows[0]["cursor_id"])
+            return None
+        except Exception as e:
+            # Reporting "no watermark" here would make the job rescan the full history
+            print(f"Error fetching watermark {name}: {e}")
+            raise
+
+    def save_watermark(self, name: str, cursor_value: str, row_id: str) -> bool:
+        """Persist how far an incremental job has processed"""
+        try:
+            self.supabase.table("etl_watermarks").upsert({
+                "name": name,
+                "cursor_value": cursor_value,
+                "cursor_id": row_id,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }, on_conflict="name", returning=ReturnMethod.minimal).execute()
+            return True
+        except Exception as e:
+            print(f"Error saving watermark {name}: {e}")
+            return False
+
+    def save_model_version(self, version: str, base_model: str, training_dataset_id: str,
+                           performance_metrics: Dict[str, Any]) -> bool:
+        """Record a trained model version"""
+        try:
+            self.supabase.table("model_versions").upsert({
+                "version": version,
+                "base_model": base_model,
+                "training_dataset_id": training_dataset_id,
+                "performance_metrics": performance_metrics,
+                "deployment_status": "registered",
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }, on_conflict="version").execute()
+            return True
+        except Exception as e:
+            print(f"Error saving model version: {e}")
+            return False
+
+class AsyncSupabaseService(AsyncStorageBackend):
+    """Async counterpart of SupabaseService for use from request handlers"""
+
+    def __init__(self, max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = None, timeout: Optional[float] = None):
+        self.supabase_url = os.getenv("SUPABASE_URL", "")
+        self.supabase_key = os.getenv("SUPABASE_KEY", "")
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=max_keepalive_connections or int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=keepalive_expiry or float(os.getenv("SUPABASE_POOL_KEEPALIVE_SECONDS", "30"))
+        )
+        self.timeout = httpx.Timeout(timeout or float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10")))
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.supabase: Optional[AsyncClient] = None
+
+    async def connect(self) -> None:
+        """Create the async Supabase client on top of one shared, keep-alive connection pool"""
+        if self.supabase is None:
+            self.http_client = httpx.AsyncClient(
+                limits=self.limits, timeout=self.timeout, http2=True, follow_redirects=True
+            )
+            self.supabase = await acreate_client(
+                self.supabase_url,
+                self.supabase_key,
+                options=AsyncClientOptions(httpx_client=self.http_client)
+            )
+
+    async def close(self) -> None:
+        """Close pooled connections"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        self.http_client = None
+        self.supabase = None
+
+    async def _client(self) -> AsyncClient:
+        await self.connect()
+        assert self.supabase is not None
+        return self.supabase
+
+    async def log_user_interactions(self, interactions: List[UserInteraction]) -> bool:
+        """Log several interactions with a single bulk insert"""
+        if not interactions:
+            return True
+        try:
+            rows = [_interaction_to_row(interaction) for interaction in interactions]
+            client = await self._client()
+            await client.table("user_interactions")\
+                .upsert(rows, on_conflict="id", ignore_duplicates=True, returning=ReturnMethod.minimal)\
+                .execute()
+            return True
+        except Exception as e:
+            print(f"Error logging {len(interactions)} interactions: {e}")
+            return False
+
+    async def get_user_history(self, user_id: str, limit: int = 50,
+                               cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch one page of a user's interactions, newest first, with the cursor of the next page"""
+        try:
+            response = await _history_query(await self._client(), user_id, limit, cursor).execute()
+            return _history_page(response.data, limit)
+        except InvalidCursor:
+            raise
+        except Exception as e:
+            print(f"Error fetching user history: {e}")
+            return [], None
+
+    async def iter_training_data_candidates(self, page_size: Optional[int] = None, columns: str = CANDIDATE_COLUMNS,
+                                            cursor_column: str = "created_at",
+                                            after: Optional[Tuple[str, str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield high-quality interactions page by page, ordered by (cursor_column, id) and starting after `after`"""
+        page_size = page_size or CANDIDATE_PAGE_SIZE
+        while True:
+            try:
+                client = await self._client()
+                response = await _candidates_page_query(client, columns, page_size, cursor_column, after).execute()
+            except Exception as e:
+                # Stopping quietly would look like the end of the data and let a partial run commit
+                print(f"Error fetching training candidates: {e}")
+                raise
+            rows: List[Dict[str, Any]] = response.data or []
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            after = (str(rows[-1][cursor_column]), str(rows[-1]["id"]))
+
+    async def get_training_data_candidates(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Retrieve high-quality interactions for training data"""
+        candidates: List[Dict[str, Any]] = []
+        try:
+            async for row in self.iter_training_data_candidates(page_size=min(limit, CANDIDATE_PAGE_SIZE)):
+                candidates.append(row)
+                if len(candidates) >= limit:
+                    break
+        except Exception:
+            return []
+        return candidates
+
+    async def save_training_data_item(self, item: TrainingDataItem) -> bool:
+        """Save curated training data item"""
+        try:
+            client = await self._client()
+            await client.table("training_data").insert(_training_item_to_row(item)).execute()
+            return True
+        except Exception as e:
+            print(f"Error saving training data: {e}")
+            return False
+
+    async def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+        """Upsert curated items in chunks keyed on their id; returns how many were written"""
+        chunk_size = chunk_size or TRAINING_DATA_CHUNK_SIZE
+        saved = 0
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            try:
+                client = await self._client()
+                await client.table("training_data")\
+                    .upsert([_training_item_to_row(item) for item in chunk], on_conflict="id",
+                            returning=ReturnMethod.minimal)\
+                    .execute()
+                saved += len(chunk)
+            except Exception as e:
+                print(f"Error saving {len(chunk)} training data items: {e}")
+        return saved
+
+    async def update_interaction_feedback(self, interaction_id: str, score: int,
+                                          feedback_text: Optional[str] = None) -> bool:
+        """Update an interaction with user feedback"""
+        try:
+            client = await self._client()
+            await client.table("user_interactions")\
+                .update(_feedback_update(score, feedback_text))\
+                .eq("id", interaction_id)\
+                .execute()
+            return True
+        except Exception as e:
+            print(f"Error updating interaction feedback: {e}")
+            return False
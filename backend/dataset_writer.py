@@ -0,0 +1,177 @@
+# Sharded Training Dataset Files for Kalimtak
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from paths import env_path, resolve_path
+
+TRAINING_DATA_DIR = env_path("TRAINING_DATA_DIR", os.path.join("..", "ai", "training_data"))
+DATASET_SHARD_ROWS = int(os.getenv("DATASET_SHARD_ROWS", "10000"))
+
+def _model_config() -> Dict[str, Any]:
+    """MODEL_CONFIG from ai/config.py, the configuration ai/train_model.py reads"""
+    spec = importlib.util.spec_from_file_location("ai_config", resolve_path(os.path.join("..", "ai", "config.py")))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.MODEL_CONFIG
+
+# Taken from the model config rather than a setting of its own, so the two cannot drift apart
+VALIDATION_SPLIT = float(_model_config()["training"]["validation_split"])
+
+MANIFEST_NAME = "manifest.json"
+SHARD_FORMAT = "jsonl.gz"
+FORMAT_VERSION = 1
+
+# Changing this reshuffles every sample between splits
+SPLIT_HASH_KEY = b"kalimtak-split-v1"
+
+def assign_split(key: str, validation_split: Optional[float] = None) -> str:
+    """
+    "train" or "validation" from a stable hash of key, so a sample keeps its side across runs.
+    Raising validation_split only moves samples from train to validation, never back.
+    """
+    fraction = VALIDATION_SPLIT if validation_split is None else validation_split
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8, key=SPLIT_HASH_KEY).digest()
+    return "validation" if int.from_bytes(digest, "big") < fraction * (1 << 64) else "train"
+
+class _HashingFile:
+    """Write-only file wrapper that checksums and counts the bytes passing through"""
+
+    def __init__(self, path: str):
+        self._file: BinaryIO = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self._file.write(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class _Shard:
+    def __init__(self, directory: str, split: str, index: int):
+        self.split = split
+        self.path = f"{split}-{index:05d}.{SHARD_FORMAT}"
+        self.rows = 0
+        self._raw = _HashingFile(os.path.join(directory, self.path))
+        # mtime=0 keeps the gzip header, and so the checksum, reproducible
+        self._gzip = gzip.GzipFile(filename="", mode="wb", fileobj=self._raw, mtime=0)
+
+    def write(self, line: bytes) -> None:
+        self._gzip.write(line)
+        self.rows += 1
+
+    def close(self) -> Dict[str, Any]:
+        self._gzip.close()
+        self._raw.close()
+        return {
+            "path": self.path,
+            "split": self.split,
+            "rows": self.rows,
+            "bytes": self._raw.bytes,
+            "sha256": self._raw.sha256.hexdigest()
+        }
+
+class ShardedDatasetWriter:
+    """
+    Write training samples as fixed-size gzip JSONL shards, one shard sequence per split,
+    plus a manifest with row counts, checksums and the source watermark. Files are written
+    to a temporary directory that is renamed into place on close, so a dataset directory
+    only ever exists complete.
+    """
+
+    def __init__(self, dataset_id: str, root: Optional[str] = None, shard_rows: Optional[int] = None):
+        self.dataset_id = dataset_id
+        self.root = root or TRAINING_DATA_DIR
+        self.shard_rows = shard_rows or DATASET_SHARD_ROWS
+        self.directory = os.path.join(self.root, dataset_id)
+        self._staging = self.directory + ".tmp"
+        os.makedirs(self._staging, exist_ok=True)
+        self._open: Dict[str, _Shard] = {}
+        self._next_index: Dict[str, int] = {}
+        self.shards: List[Dict[str, Any]] = []
+
+    def write(self, sample: Dict[str, Any], split: str = "train") -> None:
+        """Append one sample to the current shard of its split"""
+        shard = self._open.get(split)
+        if shard is None:
+            index = self._next_index.get(split, 0)
+            self._next_index[split] = index + 1
+            shard = self._open[split] = _Shard(self._staging, split, index)
+        shard.write(json.dumps(sample, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+        if shard.rows >= self.shard_rows:
+            self.shards.append(self._open.pop(split).close())
+
+    def split_counts(self) -> Dict[str, int]:
+        """Rows written per split so far"""
+        counts: Dict[str, int] = {}
+        for shard in self.shards + [{"split": s.split, "rows": s.rows} for s in self._open.values()]:
+            counts[shard["split"]] = counts.get(shard["split"], 0) + shard["rows"]
+        return counts
+
+    def close(self, watermark: Optional[Dict[str, Any]] = None,
+              metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Finish all shards, write the manifest and publish the dataset directory"""
+        for split in list(self._open):
+            self.shards.append(self._open.pop(split).close())
+        self.shards.sort(key=lambda shard: shard["path"])
+
+        manifest = {
+            "dataset_id": self.dataset_id,
+            "format": SHARD_FORMAT,
+            "format_version": FORMAT_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "shard_rows": self.shard_rows,
+            "rows": sum(shard["rows"] for shard in self.shards),
+            "splits": self.split_counts(),
+            "watermark": watermark,
+            "metadata": metadata or {},
+            "shards": self.shards
+        }
+        with open(os.path.join(self._staging, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.replace(self._staging, self.directory)
+        return manifest
+
+    def abort(self) -> None:
+        """Discard everything written so far"""
+        for shard in self._open.values():
+            shard.close()
+        self._open = {}
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """Load a dataset manifest"""
+    with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+def verify_dataset(directory: str) -> Tuple[bool, List[str]]:
+    """Check every shard's size and checksum against the manifest; returns (ok, problems)"""
+    problems: List[str] = []
+    for shard in read_manifest(directory)["shards"]:
+        path = os.path.join(directory, shard["path"])
+        if not os.path.exists(path):
+            problems.append(f"{shard['path']}: missing")
+            continue
+        if os.path.getsize(path) != shard["bytes"]:
+            problems.append(f"{shard['path']}: size mismatch")
+            continue
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        if sha256.hexdigest() != shard["sha256"]:
+            problems.append(f"{shard['path']}: checksum mismatch")
+    return not problems, problems
@@ -1,22 +1,43 @@
 # ETL Pipeline for Kalimtak Continuous Learning
+import hashlib
 import uuid
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, TypeVar
 from datetime import datetime, timezone
-from database import SupabaseService
+from storage import StorageBackend, DATASET_PRODUCER, training_data_item_id
 from models import TrainingDataItem
+from near_duplicates import NearDuplicateDetector
+from sampling import StratifiedReservoirSampler, domain_key, stratum_key
+from content_filter import get_content_filter
+from dataset_writer import ShardedDatasetWriter, assign_split
+
+Row = TypeVar("Row")
 
 class DataETLPipeline:
-    def __init__(self, db_service: SupabaseService):
+    def __init__(self, db_service: StorageBackend, chunk_size: int = 500, dataset_dir: Optional[str] = None):
         self.db_service = db_service
+        self.chunk_size = chunk_size
+        # Root directory for sharded dataset files (TRAINING_DATA_DIR when None)
+        self.dataset_dir = dataset_dir
+        # Rows that left each stage during the last streaming run
+        self.stage_counts: Dict[str, int] = {}
+        # Samples the content filter rejected during the last streaming run, by reason code
+        self.rejection_counts: Dict[str, int] = {}
     
     def extract_candidate_interactions(self, limit: int = 5000) -> List[Dict[str, Any]]:
         """Extract high-quality interactions for training"""
         return self.db_service.get_training_data_candidates(limit=limit)
     
-    def transform_for_training(self, interactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def iter_candidate_interactions(self, page_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Lazily extract every high-quality interaction, one page in memory at a time"""
+        return self.db_service.iter_training_data_candidates(page_size=page_size)
+    
+    def transform_for_training(self, interactions: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Transform interactions into training format"""
-        training_samples: List[Dict[str, Any]] = []
-        
+        return list(self.iter_transform_for_training(interactions))
+    
+    @staticmethod
+    def iter_transform_for_training(interactions: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Transform interactions into training format one at a time"""
         for interaction in interactions:
             # Filter out low-quality samples
             if interaction.get("feedback_score", 0) < 3:
@@ -27,36 +48,145 @@ class DataETLPipeline:
                 "input": f"Convert to professional prompt: {interaction['input_text']}",
                 "output": interaction["structured_prompt"],
                 "metadata": {
+                    "source_interaction_id": interaction.get("id"),
                     "domain": interaction.get("target_tool", "general"),
                     "language": interaction.get("language", "en"),
                     "quality_score": interaction.get("feedback_score", 0) / 5.0
                 }
             }
-            training_samples.append(sample)
-        
-        return training_samples
+            yield sample
     
-    def load_training_dataset(self, samples: List[Dict[str, Any]]) -> str:
-        """Load transformed data into training dataset table"""
-        dataset_id = str(uuid.uuid4())
-        
-        for sample in samples:
-            training_item = TrainingDataItem(
-                id=str(uuid.uuid4()),
-                source_interaction_id="",  # Would reference original interaction
-                input_prompt=sample["input"],
-                target_output=sample["output"],
-                quality_score=sample["metadata"]["quality_score"],
-                domain_category=sample["metadata"]["domain"],
-                use_case="prompt_generation",
-                is_curated=True,
-                is_selected=True,
-                created_at=datetime.now(timezone.utc)
+    def stream_training_samples(self, interactions: Iterable[Dict[str, Any]],
+                                max_samples_per_domain: Optional[int] = None,
+                                near_duplicates: Optional[NearDuplicateDetector] = None,
+                                workers: int = 1,
+                                max_samples_per_stratum: Optional[int] = None,
+                                validation_split: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Chain transform and quality stages as generators so only rows in flight are held in memory.
+        Rows leaving each stage are counted in stage_counts. With workers > 1 the per-row work
+        runs in a process pool and the output is identical to a single-process run.
+        With validation_split set, each sample's metadata gets a stable "split".
+        """
+        self.stage_counts = {}
+        self.rejection_counts = {}
+        samples = self._counted("extract", interactions)
+        if workers > 1:
+            samples = self._stream_parallel(samples, near_duplicates, workers)
+            return self._sampled(samples, max_samples_per_domain, max_samples_per_stratum, validation_split)
+        samples = self._counted("transform", self.iter_transform_for_training(samples))
+        samples = self._counted("deduplicate", DataQualityAssurance.iter_detect_duplicates(samples))
+        if near_duplicates is not None:
+            samples = self._counted(
+                "near_deduplicate", DataQualityAssurance.iter_detect_near_duplicates(samples, near_duplicates)
             )
-            
-            self.db_service.save_training_data_item(training_item)
-        
+        samples = self._counted(
+            "filter", DataQualityAssurance.iter_filter_inappropriate_content(samples, self._count_rejection)
+        )
+        return self._sampled(samples, max_samples_per_domain, max_samples_per_stratum, validation_split)
+    
+    def _sampled(self, samples: Iterable[Dict[str, Any]], max_samples_per_domain: Optional[int],
+                 max_samples_per_stratum: Optional[int], validation_split: Optional[float]) -> Iterator[Dict[str, Any]]:
+        if max_samples_per_domain is not None:
+            samples = self._counted(
+                "diversity", DataQualityAssurance.iter_ensure_diversity(samples, max_samples_per_domain)
+            )
+        if max_samples_per_stratum is not None:
+            samples = self._counted(
+                "stratify", DataQualityAssurance.iter_stratified_sample(samples, max_samples_per_stratum)
+            )
+        if validation_split is not None:
+            samples = self.iter_assign_splits(samples, validation_split)
+        return iter(samples)
+    
+    @staticmethod
+    def iter_assign_splits(samples: Iterable[Dict[str, Any]],
+                           validation_split: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Tag each sample train or validation by a hash of its source interaction, without buffering"""
+        for sample in samples:
+            metadata = sample["metadata"]
+            # Samples without a source fall back to their content, like training data item ids
+            key = str(metadata.get("source_interaction_id") or f"{sample['input']}\n{sample['output']}")
+            metadata["split"] = assign_split(key, validation_split)
+            yield sample
+    
+    def _stream_parallel(self, interactions: Iterable[Dict[str, Any]],
+                         near_duplicates: Optional[NearDuplicateDetector],
+                         workers: int) -> Iterator[Dict[str, Any]]:
+        from parallel_etl import ParallelETLRunner
+
+        # Workers transform, hash and screen chunks; the order-dependent decisions stay here
+        runner = ParallelETLRunner(workers, near_duplicates=near_duplicates)
+        prepared = self._counted("transform", runner.iter_prepared(interactions))
+        prepared = self._counted("deduplicate", runner.iter_unique(prepared))
+        if near_duplicates is not None:
+            prepared = self._counted("near_deduplicate", runner.iter_near_unique(prepared))
+        prepared = self._counted("filter", runner.iter_appropriate(prepared, self._count_rejection))
+        return (item.sample for item in prepared)
+    
+    def _count_rejection(self, sample: Dict[str, Any], reason: str) -> None:
+        self.rejection_counts[reason] = self.rejection_counts.get(reason, 0) + 1
+    
+    def _counted(self, stage: str, rows: Iterable[Row]) -> Iterator[Row]:
+        self.stage_counts.setdefault(stage, 0)
+        for row in rows:
+            self.stage_counts[stage] += 1
+            yield row
+    
+    def load_training_dataset(self, samples: Iterable[Dict[str, Any]]) -> str:
+        """Load transformed data into training dataset table and write it as sharded files"""
+        dataset_id = str(uuid.uuid4())
+        writer = self.dataset_writer(dataset_id)
+        self.load_training_samples(samples, writer)
+        writer.close(metadata={"stage_counts": self.stage_counts})
         return dataset_id
+    
+    def dataset_writer(self, dataset_id: str) -> ShardedDatasetWriter:
+        """Writer for the shard files of one dataset"""
+        return ShardedDatasetWriter(dataset_id, root=self.dataset_dir)
+    
+    def load_training_samples(self, samples: Iterable[Dict[str, Any]],
+                              writer: Optional[ShardedDatasetWriter] = None) -> int:
+        """
+        Upsert transformed samples into the training data table in chunks; returns how many were written.
+        Every sample is also appended to writer's shards when one is given.
+        """
+        self.stage_counts["load"] = 0
+        self.stage_counts["load_failed"] = 0
+        chunk: List[TrainingDataItem] = []
+        for sample in samples:
+            if writer is not None:
+                writer.write(sample, split=sample["metadata"].get("split", "train"))
+            chunk.append(self._training_item(sample))
+            if len(chunk) >= self.chunk_size:
+                self._load_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._load_chunk(chunk)
+        return self.stage_counts["load"]
+    
+    def _load_chunk(self, chunk: List[TrainingDataItem]) -> None:
+        saved = self.db_service.save_training_data_items(chunk, chunk_size=self.chunk_size)
+        self.stage_counts["load"] += saved
+        self.stage_counts["load_failed"] += len(chunk) - saved
+    
+    @staticmethod
+    def _training_item(sample: Dict[str, Any]) -> TrainingDataItem:
+        source_interaction_id = str(sample["metadata"].get("source_interaction_id") or "")
+        # Re-loading the same interaction (or the same pair when the source is unknown) updates one row
+        source_key = source_interaction_id or f"{sample['input']}\n{sample['output']}"
+        return TrainingDataItem(
+            id=training_data_item_id(source_key, DATASET_PRODUCER),
+            source_interaction_id=source_interaction_id,
+            input_prompt=sample["input"],
+            target_output=sample["output"],
+            quality_score=sample["metadata"]["quality_score"],
+            domain_category=sample["metadata"]["domain"],
+            use_case="prompt_generation",
+            is_curated=True,
+            is_selected=True,
+            created_at=datetime.now(timezone.utc)
+        )
 
 class DataQualityAssurance:
     """Ensure data quality for training"""
@@ -64,41 +194,94 @@ class DataQualityAssurance:
     @staticmethod
     def detect_duplicates(samples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Remove duplicate samples"""
-        seen: set[Tuple[str, str]] = set()
-        unique_samples: List[Dict[str, Any]] = []
+        return list(DataQualityAssurance.iter_detect_duplicates(samples))
+    
+    @staticmethod
+    def iter_detect_duplicates(samples: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Remove duplicate samples while streaming, keeping a 16-byte digest per unique sample"""
+        seen: set[bytes] = set()
         
         for sample in samples:
-            # Create a hashable representation of the sample
-            sample_key = (sample["input"], sample["output"])
+            sample_key = DataQualityAssurance.sample_digest(sample)
             if sample_key not in seen:
                 seen.add(sample_key)
-                unique_samples.append(sample)
+                yield sample
+    
+    @staticmethod
+    def sample_digest(sample: Dict[str, Any]) -> bytes:
+        """Compact hashable representation of a sample's input and output"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(sample["input"].encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(sample["output"].encode("utf-8"))
+        return digest.digest()
+    
+    @staticmethod
+    def near_duplicate_text(sample: Dict[str, Any]) -> str:
+        """Text compared by the near-duplicate detector"""
+        return f"{sample['input']}\n{sample['output']}"
+    
+    @staticmethod
+    def detect_near_duplicates(samples: List[Dict[str, Any]],
+                               threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Remove samples that are near-identical to an earlier sample"""
+        return list(DataQualityAssurance.iter_detect_near_duplicates(samples, NearDuplicateDetector(threshold)))
+    
+    @staticmethod
+    def iter_detect_near_duplicates(samples: Iterable[Dict[str, Any]],
+                                    detector: Optional[NearDuplicateDetector] = None) -> Iterator[Dict[str, Any]]:
+        """Remove near-duplicates while streaming, using MinHash/LSH over input and output"""
+        detector = detector or NearDuplicateDetector()
         
-        return unique_samples
+        for sample in samples:
+            if not detector.is_duplicate(DataQualityAssurance.near_duplicate_text(sample)):
+                yield sample
     
     @staticmethod
     def filter_inappropriate_content(samples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Filter out inappropriate content"""
-        # In a real implementation, this would use a content moderation model
-        # For now, we'll just return the samples as-is
-        return samples
+        return list(DataQualityAssurance.iter_filter_inappropriate_content(samples))
     
     @staticmethod
-    def ensure_diversity(samples: List[Dict[str, Any]], max_samples_per_domain: int = 100) -> List[Dict[str, Any]]:
-        """Ensure diversity across domains"""
-        domain_counts: Dict[str, int] = {}
-        diverse_samples: List[Dict[str, Any]] = []
-        
+    def iter_filter_inappropriate_content(samples: Iterable[Dict[str, Any]],
+                                          on_reject: Optional[Callable[[Dict[str, Any], str], None]] = None
+                                          ) -> Iterator[Dict[str, Any]]:
+        """Filter out inappropriate content while streaming; on_reject gets each rejected sample and its reason code"""
         for sample in samples:
-            domain = sample["metadata"]["domain"]
-            
-            # Initialize count for domain if not present
-            if domain not in domain_counts:
-                domain_counts[domain] = 0
-            
-            # Add sample if we haven't exceeded the limit for this domain
-            if domain_counts[domain] < max_samples_per_domain:
-                diverse_samples.append(sample)
-                domain_counts[domain] += 1
-        
-        return diverse_samples
\ No newline at end of file
+            reason = DataQualityAssurance.rejection_reason(sample)
+            if reason is None:
+                yield sample
+            elif on_reject is not None:
+                on_reject(sample, reason)
+    
+    @staticmethod
+    def rejection_reason(sample: Dict[str, Any]) -> Optional[str]:
+        """Blocklist reason code if the sample's input or output is inappropriate, else None"""
+        match = get_content_filter().check(sample["input"], sample["output"])
+        return match.reason if match is not None else None
+    
+    @staticmethod
+    def ensure_diversity(samples: List[Dict[str, Any]], max_samples_per_domain: int = 100,
+                         seed: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Ensure diversity across domains"""
+        return list(DataQualityAssurance.iter_ensure_diversity(samples, max_samples_per_domain, seed))
+    
+    @staticmethod
+    def iter_ensure_diversity(samples: Iterable[Dict[str, Any]], max_samples_per_domain: int = 100,
+                              seed: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Keep a seeded random sample of at most max_samples_per_domain per domain, in one pass"""
+        sampler = StratifiedReservoirSampler(max_samples_per_domain, key=domain_key, seed=seed)
+        return sampler.iter_sample(samples)
+    
+    @staticmethod
+    def stratified_sample(samples: List[Dict[str, Any]], max_samples_per_stratum: int = 100,
+                          seed: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Balance samples across domain, language and quality bucket"""
+        return list(DataQualityAssurance.iter_stratified_sample(samples, max_samples_per_stratum, seed))
+    
+    @staticmethod
+    def iter_stratified_sample(samples: Iterable[Dict[str, Any]], max_samples_per_stratum: int = 100,
+                               seed: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Keep a seeded random sample of at most max_samples_per_stratum per (domain, language, quality bucket)"""
+        sampler = StratifiedReservoirSampler(max_samples_per_stratum, key=stratum_key, seed=seed)
+        return sampler.iter_sample(samples)
\ No newline at end of file
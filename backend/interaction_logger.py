@@ -0,0 +1,173 @@
+# Write-Behind Interaction Logger for Kalimtak
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from storage import StorageBackend
+from interaction_spool import InteractionSpool
+from models import UserInteraction
+
+class BatchedInteractionLogger:
+    """Buffer interactions in a bounded queue and bulk-insert them from a background thread"""
+
+    def __init__(self, db_service: StorageBackend, max_queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None, flush_interval_seconds: Optional[float] = None,
+                 max_retries: int = 3, retry_backoff_seconds: float = 0.5,
+                 spool: Optional[InteractionSpool] = None):
+        self.db_service = db_service
+        self.spool = spool
+        self.max_queue_size = max_queue_size or int(os.getenv("INTERACTION_LOG_QUEUE_SIZE", "10000"))
+        self.batch_size = batch_size or int(os.getenv("INTERACTION_LOG_BATCH_SIZE", "500"))
+        self.flush_interval_seconds = flush_interval_seconds or float(os.getenv("INTERACTION_LOG_FLUSH_SECONDS", "1.0"))
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+        self._queue: "queue.Queue[UserInteraction]" = queue.Queue(maxsize=self.max_queue_size)
+        # Overflow waits here for the spool thread, so callers on the event loop never write or fsync the spool
+        self._overflow: "queue.Queue[UserInteraction]" = queue.Queue(maxsize=self.max_queue_size)
+        self._stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.spool_thread: Optional[threading.Thread] = None
+
+        # Metrics reported through stats()
+        self.enqueued = 0
+        self.spooled = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.retries = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self) -> None:
+        """Start the background flusher"""
+        if self.thread is None or not self.thread.is_alive():
+            self._stopping.clear()
+            self.thread = threading.Thread(target=self._run, name="interaction-logger", daemon=True)
+            self.thread.start()
+        if self.spool and (self.spool_thread is None or not self.spool_thread.is_alive()):
+            self.spool_thread = threading.Thread(target=self._run_spool, name="interaction-spooler", daemon=True)
+            self.spool_thread.start()
+
+    def stop(self, timeout: float = 30) -> None:
+        """Flush everything still queued and stop the background flusher"""
+        self._stopping.set()
+        for thread in (self.thread, self.spool_thread):
+            if thread and thread.is_alive():
+                thread.join(timeout=timeout)
+
+    def submit(self, interaction: UserInteraction) -> bool:
+        """Queue an interaction without blocking; returns False if it could not be kept"""
+        try:
+            self._queue.put_nowait(interaction)
+            self.enqueued += 1
+            return True
+        except queue.Full:
+            # Overflow goes to the local spool from the spool thread and is replayed when the backlog clears
+            if self.spool:
+                try:
+                    self._overflow.put_nowait(interaction)
+                    return True
+                except queue.Full:
+                    pass
+            self.dropped += 1
+            print("Interaction log queue is full, dropping interaction")
+            return False
+
+    def submit_many(self, interactions: List[UserInteraction]) -> int:
+        """Queue several interactions; returns how many were accepted"""
+        return sum(1 for interaction in interactions if self.submit(interaction))
+
+    def _run(self) -> None:
+        """Flush by size or time threshold until stopped and drained"""
+        while not self._stopping.is_set() or not self._queue.empty():
+            batch = self._take_batch(self._queue)
+            if batch:
+                self._flush(batch)
+            if self.spool:
+                self.spool.sync()
+
+    def _run_spool(self) -> None:
+        """Write overflow to the spool until stopped and drained"""
+        assert self.spool is not None
+        while not self._stopping.is_set() or not self._overflow.empty():
+            batch = self._take_batch(self._overflow)
+            if batch:
+                accepted = self.spool.append(batch)
+                self.spool.sync()
+                self.spooled += accepted
+                self.dropped += len(batch) - accepted
+
+    def _take_batch(self, source: "queue.Queue[UserInteraction]") -> List[UserInteraction]:
+        """Collect up to batch_size interactions from a queue, waiting at most one flush interval"""
+        batch: List[UserInteraction] = []
+        deadline = time.monotonic() + self.flush_interval_seconds
+
+        while len(batch) < self.batch_size:
+            if self._stopping.is_set():
+                try:
+                    batch.append(source.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # Wake up regularly so a shutdown request is noticed quickly
+                batch.append(source.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                continue
+
+        return batch
+
+    def _flush(self, batch: List[UserInteraction]) -> bool:
+        """Bulk-insert one batch, retrying with exponential backoff"""
+        start = time.perf_counter()
+        success = False
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                time.sleep(self.retry_backoff_seconds * (2 ** (attempt - 1)))
+            if self.db_service.log_user_interactions(batch):
+                success = True
+                break
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+        if success:
+            self.flushed += len(batch)
+        elif self.spool and self.spool.append(batch):
+            self.spooled += len(batch)
+            self.spool.sync()
+            print(f"Spooled {len(batch)} interactions after {self.max_retries} retries")
+        else:
+            self.failed += len(batch)
+            print(f"Giving up on {len(batch)} interactions after {self.max_retries} retries")
+        return success
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, throughput and flush latency"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "overflow_depth": self._overflow.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "spooled": self.spooled,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0,
+            "max_flush_ms": self.max_flush_ms
+        }
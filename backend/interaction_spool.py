@@ -0,0 +1,315 @@
+# Durable Local Spool for Kalimtak Interaction Logs
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from storage import StorageBackend
+from models import UserInteraction
+from paths import env_path
+
+# Advisory file locks, released by the OS when the process holding them exits
+try:
+    fcntl: Any = __import__('fcntl')
+    msvcrt: Any = None
+except ImportError:
+    fcntl = None
+    msvcrt = __import__('msvcrt')
+
+SEALED_SUFFIX = ".jsonl"
+OPEN_SUFFIX = ".jsonl.open"
+CLAIM_SUFFIX = ".claim-"
+OWNER_SUFFIX = ".owner"
+
+def _lock(file: Any) -> None:
+    """Take an exclusive lock on an open file, waiting for it; raises OSError on failure"""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+def _try_lock(file: Any) -> bool:
+    """Take an exclusive lock on an open file without waiting; False if another handle holds it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+class InteractionSpool:
+    """
+    Append-only JSONL spool for interactions that could not be written to the database.
+    Segments on disk are replayed in bulk once the database accepts writes again,
+    including segments left over from a previous process.
+
+    Several processes can share one directory. Each holds a locked <owner>.owner marker
+    for its lifetime. It appends to its own <name>-<owner>.jsonl.open segment and seals it
+    by renaming it to .jsonl, and only sealed segments are replayed. A replayer claims a
+    segment by renaming it to .jsonl.claim-<owner>. Open segments and claims whose owner
+    marker is gone or unlocked belong to a dead process and are sealed again.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                 segment_bytes: Optional[int] = None, fsync_batch_size: int = 100):
+        self.directory = directory or env_path("INTERACTION_SPOOL_DIR", "spool")
+        self.max_bytes = max_bytes or int(os.getenv("INTERACTION_SPOOL_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.segment_bytes = segment_bytes or int(os.getenv("INTERACTION_SPOOL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+        self.fsync_batch_size = fsync_batch_size
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.owner = uuid.uuid4().hex
+        self._owner_marker = self._create_owner_marker()
+
+        self._lock = threading.Lock()
+        self._active: Optional[Any] = None
+        self._active_size = 0
+        self._unsynced = 0
+        self.recover_orphans()
+        self._total_bytes = sum(os.path.getsize(path) for path in self._data_files())
+
+        self._stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+        # Metrics reported through stats()
+        self.spooled = 0
+        self.dropped = 0
+        self.replayed = 0
+        self.corrupt = 0
+        self.fsyncs = 0
+
+    def segments(self) -> List[str]:
+        """Sealed segment paths, oldest first; only these are replayed"""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEALED_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _data_files(self) -> List[str]:
+        """Sealed, open and claimed segments of every process"""
+        return [
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.endswith(SEALED_SUFFIX) or name.endswith(OPEN_SUFFIX) or (CLAIM_SUFFIX in name and not name.endswith(".tmp"))
+        ]
+
+    def _create_owner_marker(self) -> Any:
+        """Lock the owner marker under a temporary name, so it is never visible unlocked"""
+        path = os.path.join(self.directory, self.owner + OWNER_SUFFIX)
+        marker = open(path + ".tmp", "wb")
+        try:
+            _lock(marker)
+            os.replace(path + ".tmp", path)
+        except BaseException:
+            marker.close()
+            os.remove(path + ".tmp")
+            raise
+        return marker
+
+    def _owner_alive(self, owner: str) -> bool:
+        if owner == self.owner:
+            return True
+        try:
+            # Never create a marker here: a missing one means its owner is gone
+            with open(os.path.join(self.directory, owner + OWNER_SUFFIX), "rb") as marker:
+                # A live owner holds the lock on its marker
+                return not _try_lock(marker)
+        except FileNotFoundError:
+            return False
+
+    def recover_orphans(self) -> int:
+        """Seal open segments and release claims left behind by processes that are gone"""
+        recovered = 0
+        dead_owners: set[str] = set()
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".tmp"):
+                continue
+            if name.endswith(OPEN_SUFFIX):
+                owner = name[:-len(OPEN_SUFFIX)].rsplit("-", 1)[-1]
+                sealed = name[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX
+            elif CLAIM_SUFFIX in name:
+                sealed, owner = name.split(CLAIM_SUFFIX, 1)
+            else:
+                continue
+            if owner in dead_owners or not self._owner_alive(owner):
+                dead_owners.add(owner)
+                try:
+                    os.replace(os.path.join(self.directory, name), os.path.join(self.directory, sealed))
+                    recovered += 1
+                except FileNotFoundError:
+                    pass  # Another process recovered it first
+
+        for name in os.listdir(self.directory):
+            owner = name[:-len(OWNER_SUFFIX)]
+            if name.endswith(OWNER_SUFFIX) and (owner in dead_owners or not self._owner_alive(owner)):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        if recovered:
+            print(f"Recovered {recovered} interaction spool segments from stopped processes")
+        return recovered
+
+    def append(self, interactions: List[UserInteraction]) -> int:
+        """Append interactions to the active segment; returns how many were accepted"""
+        if not interactions:
+            return 0
+
+        lines = [(interaction.model_dump_json() + "\n").encode("utf-8") for interaction in interactions]
+        size = sum(len(line) for line in lines)
+
+        with self._lock:
+            if self._total_bytes + size > self.max_bytes:
+                self.dropped += len(interactions)
+                print(f"Interaction spool is full, dropping {len(interactions)} interactions")
+                return 0
+
+            if self._active is None:
+                path = os.path.join(self.directory, f"interactions-{time.time_ns():020d}-{self.owner}{OPEN_SUFFIX}")
+                self._active = open(path, "ab")
+                self._active_size = 0
+
+            self._active.write(b"".join(lines))
+            self._active_size += size
+            self._total_bytes += size
+            self._unsynced += len(lines)
+            self.spooled += len(lines)
+
+            if self._unsynced >= self.fsync_batch_size:
+                self._sync_locked()
+            if self._active_size >= self.segment_bytes:
+                self._rotate_locked()
+
+        return len(interactions)
+
+    def sync(self) -> None:
+        """Flush and fsync anything appended since the last sync"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self) -> None:
+        if self._active is not None and self._unsynced:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._unsynced = 0
+            self.fsyncs += 1
+
+    def _rotate_locked(self) -> None:
+        """Close and seal the active segment so it can be replayed"""
+        if self._active is not None:
+            self._sync_locked()
+            self._active.close()
+            path = self._active.name
+            self._active = None
+            self._active_size = 0
+            try:
+                os.replace(path, path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+            except FileNotFoundError as e:
+                print(f"Error sealing interaction spool segment: {e}")
+
+    def replay(self, db_service: StorageBackend, batch_size: int = 500) -> int:
+        """Bulk-insert spooled interactions, stopping at the first failed batch"""
+        with self._lock:
+            self._rotate_locked()
+        self.recover_orphans()
+
+        replayed = 0
+        for sealed_path in self.segments():
+            # Claiming by rename makes sure no other process replays the same segment
+            path = sealed_path + CLAIM_SUFFIX + self.owner
+            try:
+                os.replace(sealed_path, path)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(path, "rb") as segment:
+                    lines = [line for line in segment if line.strip()]
+
+                interactions: List[UserInteraction] = []
+                for line in lines:
+                    try:
+                        interactions.append(UserInteraction.model_validate_json(line))
+                    except ValueError:
+                        self.corrupt += 1
+
+                for start in range(0, len(interactions), batch_size):
+                    if not db_service.log_user_interactions(interactions[start:start + batch_size]):
+                        # Keep what is left so the next attempt, or the next process, resumes here
+                        self._rewrite(path, interactions[start:])
+                        os.replace(path, sealed_path)
+                        self.replayed += replayed
+                        return replayed
+                    replayed += len(interactions[start:start + batch_size])
+
+                size = os.path.getsize(path)
+                os.remove(path)
+                with self._lock:
+                    self._total_bytes -= size
+            except BaseException:
+                # Hand the segment back so a later replay picks it up
+                os.replace(path, sealed_path)
+                raise
+
+        self.replayed += replayed
+        if replayed:
+            print(f"Replayed {replayed} spooled interactions")
+        return replayed
+
+    def _rewrite(self, path: str, remaining: List[UserInteraction]) -> None:
+        """Atomically replace a segment with its unreplayed interactions"""
+        old_size = os.path.getsize(path)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as segment:
+            for interaction in remaining:
+                segment.write((interaction.model_dump_json() + "\n").encode("utf-8"))
+            segment.flush()
+            os.fsync(segment.fileno())
+        os.replace(temp_path, path)
+        with self._lock:
+            self._total_bytes += os.path.getsize(path) - old_size
+
+    def start_replay(self, db_service: StorageBackend, interval_seconds: Optional[float] = None) -> None:
+        """Start a background worker that drains the spool periodically"""
+        interval = interval_seconds or float(os.getenv("INTERACTION_SPOOL_REPLAY_SECONDS", "30"))
+
+        def run() -> None:
+            while not self._stopping.is_set():
+                try:
+                    self.replay(db_service)
+                except Exception as e:
+                    print(f"Error replaying interaction spool: {e}")
+                self._stopping.wait(interval)
+
+        if self.thread is None or not self.thread.is_alive():
+            self._stopping.clear()
+            self.thread = threading.Thread(target=run, name="interaction-spool-replay", daemon=True)
+            self.thread.start()
+
+    def close(self) -> None:
+        """Stop the replay worker, seal the active segment and give up the owner marker"""
+        self._stopping.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+        with self._lock:
+            self._rotate_locked()
+            if not self._owner_marker.closed:
+                # Our segments are sealed, so a recoverer that sees the marker unlocked has nothing to take
+                self._owner_marker.close()
+                try:
+                    os.remove(os.path.join(self.directory, self.owner + OWNER_SUFFIX))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Spool size and replay counters"""
+        return {
+            "segments": len(self.segments()),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "spooled": self.spooled,
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+            "corrupt": self.corrupt,
+            "fsyncs": self.fsyncs
+        }
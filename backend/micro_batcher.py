@@ -0,0 +1,109 @@
+# Micro-Batching Scheduler for Kalimtak Upstream LLM Calls
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collect pending requests for a short window, or until a batch is full,
+    and send them upstream as a single batched call
+    """
+
+    def __init__(self, batch_fn: Callable[[List[T]], Awaitable[List[R]]],
+                 max_batch_size: int = 8, window_ms: float = 10.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.window_ms = window_ms
+        self._pending: List[Tuple[T, "asyncio.Future[R]", float]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set["asyncio.Future[None]"] = set()
+
+        # Metrics reported through stats()
+        self.batches = 0
+        self.items = 0
+        self.batch_size_counts: Dict[int, int] = {}
+        self.total_queue_delay_ms = 0.0
+        self.max_queue_delay_ms = 0.0
+
+    async def submit(self, item: T) -> R:
+        """Queue one request and wait for its share of the batched result"""
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[R]" = loop.create_future()
+        self._pending.append((item, future, time.monotonic()))
+
+        if len(self._pending) >= self.max_batch_size or self.window_ms <= 0:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Dispatch everything collected so far as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        now = time.monotonic()
+        self.batches += 1
+        self.items += len(batch)
+        self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+        for _, _, enqueued_at in batch:
+            delay_ms = (now - enqueued_at) * 1000
+            self.total_queue_delay_ms += delay_ms
+            self.max_queue_delay_ms = max(self.max_queue_delay_ms, delay_ms)
+
+        # The loop only keeps weak references to tasks, so hold on to each batch until it finishes
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[T, "asyncio.Future[R]", float]]) -> None:
+        """Call upstream and fan the results back out to the waiting requests"""
+        try:
+            results = await self.batch_fn([item for item, _, _ in batch])
+        except BaseException as e:
+            # Including cancellation, so no request waits on a batch that will never answer
+            self._fail(batch, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        if len(results) != len(batch):
+            # Results are matched by position, so with a wrong count none of them can be trusted
+            self._fail(batch, RuntimeError(
+                f"Batch call returned {len(results)} results for {len(batch)} requests"
+            ))
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(batch: List[Tuple[T, "asyncio.Future[R]", float]], error: BaseException) -> None:
+        """Fail every request of a batch that is still waiting"""
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size distribution and queueing delay"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window_ms,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "avg_queue_delay_ms": self.total_queue_delay_ms / self.items if self.items else 0.0,
+            "max_queue_delay_ms": self.max_queue_delay_ms
+        }
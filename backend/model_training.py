@@ -1,20 +1,39 @@
 # Model Training Orchestrator for Kalimtak
+import os
 import time
+import uuid
 from typing import Dict, Any
-from database import SupabaseService
+from storage import StorageBackend
 from etl_pipeline import DataETLPipeline
+from curation import CandidateStream, DATASET_WATERMARK
+from near_duplicates import NearDuplicateDetector
+from parallel_etl import ETL_WORKERS
+from content_filter import get_content_filter
+from dataset_writer import VALIDATION_SPLIT
+from response_cache import get_response_cache
+
+# Model version currently serving generation requests
+_active_model_version: str = os.getenv("MODEL_VERSION", "mock-v1.0")
+
+# Training is still simulated, so its versions are only served when this is turned on
+MODEL_AUTO_DEPLOY = os.getenv("MODEL_AUTO_DEPLOY", "false").lower() == "true"
+
+def get_active_model_version() -> str:
+    """Get the model version currently deployed to production"""
+    return _active_model_version
 
 class ModelRegistry:
     """Manage model versions and deployments"""
     
-    def __init__(self, db_service: SupabaseService):
+    def __init__(self, db_service: StorageBackend):
         self.db_service = db_service
     
     def register_model_version(self, version: str, base_model: str, 
                              training_dataset_id: str, performance_metrics: Dict[str, Any]) -> bool:
         """Register a new model version"""
         try:
-            # In a real implementation, this would save to the database
+            if not self.db_service.save_model_version(version, base_model, training_dataset_id, performance_metrics):
+                return False
             print(f"Registered model version: {version}")
             return True
         except Exception as e:
@@ -23,8 +42,17 @@ class ModelRegistry:
     
     def deploy_model(self, version: str) -> bool:
         """Deploy model to production"""
+        global _active_model_version
         try:
             # In a real implementation, this would update deployment configuration
+            previous_version = _active_model_version
+            _active_model_version = version
+
+            # Cached prompts from the previous model must not be served any more
+            if previous_version != version:
+                removed = get_response_cache().invalidate(previous_version)
+                print(f"Invalidated {removed} cached responses for model version {previous_version}")
+
             print(f"Deployed model version: {version}")
             return True
         except Exception as e:
@@ -32,17 +60,43 @@ class ModelRegistry:
             return False
 
 class ModelTrainingOrchestrator:
-    def __init__(self, db_service: SupabaseService):
+    def __init__(self, db_service: StorageBackend):
         self.db_service = db_service
         self.model_registry = ModelRegistry(db_service)
         self.etl_pipeline = DataETLPipeline(db_service)
     
     def prepare_training_dataset(self) -> str:
         """Prepare dataset for training"""
-        # Extract and transform data
-        interactions = self.etl_pipeline.extract_candidate_interactions()
-        samples = self.etl_pipeline.transform_for_training(interactions)
-        dataset_id = self.etl_pipeline.load_training_dataset(samples)
+        # Extract and transform only interactions created or re-scored since the last dataset
+        interactions = CandidateStream(self.db_service, DATASET_WATERMARK)
+        samples = self.etl_pipeline.stream_training_samples(
+            interactions, near_duplicates=NearDuplicateDetector(), workers=ETL_WORKERS,
+            validation_split=VALIDATION_SPLIT
+        )
+        dataset_id = str(uuid.uuid4())
+        writer = self.etl_pipeline.dataset_writer(dataset_id)
+        try:
+            self.etl_pipeline.load_training_samples(samples, writer)
+        except Exception:
+            writer.abort()
+            raise
+        if self.etl_pipeline.stage_counts["load_failed"] == 0:
+            # Files are only published for a complete load, together with the watermark it covers
+            writer.close(
+                watermark={"name": interactions.name, "start": interactions.start, "end": interactions.position},
+                metadata={
+                    "validation_split": VALIDATION_SPLIT,
+                    "stage_counts": self.etl_pipeline.stage_counts,
+                    "rejection_counts": self.etl_pipeline.rejection_counts,
+                    "content_filter": get_content_filter().version
+                }
+            )
+            interactions.commit()
+        else:
+            writer.abort()
+        print(f"Prepared dataset {dataset_id}: {self.etl_pipeline.stage_counts}")
+        if self.etl_pipeline.rejection_counts:
+            print(f"Content filter rejections: {self.etl_pipeline.rejection_counts}")
         return dataset_id
     
     def fine_tune_model(self, base_model: str, dataset_id: str) -> str:
@@ -106,8 +160,11 @@ class ModelTrainingOrchestrator:
         )
         
         # 5. Deploy model (in real implementation, this would be gradual)
-        print("5. Deploying model...")
-        self.deploy_model(new_version)
+        if MODEL_AUTO_DEPLOY:
+            print("5. Deploying model...")
+            self.deploy_model(new_version)
+        else:
+            print(f"5. Not deploying {new_version}; still serving {get_active_model_version()} (MODEL_AUTO_DEPLOY=false)")
         
         print(f"Training cycle completed. New model version: {new_version}")
         return new_version
\ No newline at end of file
@@ -45,6 +45,7 @@ class UserInteraction(BaseModel):
     feedback_text: Optional[str] = None
     ip_address: Optional[str] = None
     user_agent: Optional[str] = None
+    cache_hit: bool = False
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,138 @@
+# Near-Duplicate Detection for Kalimtak Training Data
+import hashlib
+import os
+import random
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+from response_cache import normalize_text
+
+# NumPy is optional; signatures fall back to pure Python without it
+try:
+    np: Any = __import__('numpy')
+except ImportError:
+    np = None
+
+# Largest prime below 2**32, so permuted shingle hashes stay 32-bit
+HASH_PRIME = 4294967291
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Pick (bands, rows) so the LSH similarity curve crosses 50% near the threshold"""
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+class NearDuplicateDetector:
+    """
+    Streaming near-duplicate filter: text is shingled, MinHashed and split into LSH bands.
+    Each band is a fixed-size table of bucket fingerprints, so memory is bounded by
+    num_buckets no matter how many samples pass through. A full table overwrites older
+    fingerprints, which can only miss duplicates, never invent them.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, num_perm: int = 64, shingle: str = "word",
+                 shingle_size: Optional[int] = None, num_buckets: Optional[int] = None, seed: int = 1,
+                 bands: Optional[int] = None, rows: Optional[int] = None):
+        self.threshold = threshold if threshold is not None else float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+        if shingle not in ("word", "char"):
+            raise ValueError(f"Unknown shingle type: {shingle}")
+        self.shingle = shingle
+        self.shingle_size = shingle_size or (3 if shingle == "word" else 5)
+        self.num_buckets = num_buckets or int(os.getenv("NEAR_DUPLICATE_BUCKETS", str(1 << 19)))
+        if bands and rows:
+            self.bands, self.rows = bands, rows
+        else:
+            self.bands, self.rows = choose_bands(num_perm, self.threshold)
+        self.num_perm = self.bands * self.rows
+        self.seed = seed
+
+        # Universal hash functions (a * x + b) mod p, one per permutation
+        rng = random.Random(seed)
+        self._a = [rng.randrange(1, 1 << 31) for _ in range(self.num_perm)]
+        self._b = [rng.randrange(0, 1 << 31) for _ in range(self.num_perm)]
+        if np is not None:
+            self._np_a = np.array(self._a, dtype=np.uint64)[:, None]
+            self._np_b = np.array(self._b, dtype=np.uint64)[:, None]
+            self._tables: Any = np.zeros((self.bands, self.num_buckets), dtype=np.uint32)
+        else:
+            self._tables = [array('I', bytes(4 * self.num_buckets)) for _ in range(self.bands)]
+
+        # Metrics reported through stats()
+        self.seen = 0
+        self.duplicates = 0
+
+    def shingles(self, text: str) -> List[int]:
+        """crc32 hashes of the word or character shingles of normalized text"""
+        normalized = normalize_text(text)
+        if self.shingle == "word":
+            tokens = normalized.split(" ")
+            grams = [" ".join(tokens[i:i + self.shingle_size])
+                     for i in range(max(1, len(tokens) - self.shingle_size + 1))]
+        else:
+            grams = [normalized[i:i + self.shingle_size]
+                     for i in range(max(1, len(normalized) - self.shingle_size + 1))]
+        return list({zlib.crc32(gram.encode("utf-8")) for gram in grams})
+
+    def signature(self, text: str) -> List[int]:
+        """MinHash signature with num_perm values"""
+        hashes = self.shingles(text)
+        if np is not None:
+            x = np.array(hashes, dtype=np.uint64)[None, :]
+            permuted = (self._np_a * x + self._np_b) % np.uint64(HASH_PRIME)
+            return permuted.min(axis=1).tolist()
+        return [min((a * x + b) % HASH_PRIME for x in hashes) for a, b in zip(self._a, self._b)]
+
+    def band_hashes(self, text: str) -> List[int]:
+        """64-bit hash per LSH band; stateless, so it can be computed in worker processes"""
+        signature = self.signature(text)
+        hashes: List[int] = []
+        for band in range(self.bands):
+            values = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(array('I', values).tobytes(), digest_size=8, salt=band.to_bytes(8, "little"))
+            hashes.append(int.from_bytes(digest.digest(), "little"))
+        return hashes
+
+    def check_and_add(self, band_hashes: List[int]) -> bool:
+        """Check band hashes against everything seen so far, then remember them"""
+        self.seen += 1
+        # Low bits pick the bucket, high bits are the fingerprint stored in it (never zero)
+        keys = [(band_hash % self.num_buckets, (band_hash >> 32) | 1) for band_hash in band_hashes]
+        duplicate = any(self._tables[band][bucket] == fingerprint for band, (bucket, fingerprint) in enumerate(keys))
+        if duplicate:
+            self.duplicates += 1
+        else:
+            for band, (bucket, fingerprint) in enumerate(keys):
+                self._tables[band][bucket] = fingerprint
+        return duplicate
+
+    def is_duplicate(self, text: str) -> bool:
+        """Check text against everything seen so far, then remember it"""
+        return self.check_and_add(self.band_hashes(text))
+
+    def hash_config(self) -> Dict[str, Any]:
+        """Arguments that reproduce this detector's band hashes in another process"""
+        return {
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "shingle": self.shingle,
+            "shingle_size": self.shingle_size,
+            "seed": self.seed
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Detector configuration and counters"""
+        return {
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "num_buckets": self.num_buckets,
+            "table_bytes": self.bands * self.num_buckets * 4,
+            "seen": self.seen,
+            "duplicates": self.duplicates
+        }
@@ -0,0 +1,107 @@
+# Parallel ETL Execution for Kalimtak
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from etl_pipeline import DataETLPipeline, DataQualityAssurance
+from near_duplicates import NearDuplicateDetector
+
+ETL_WORKERS = int(os.getenv("ETL_WORKERS", "1"))
+ETL_WORKER_CHUNK_SIZE = int(os.getenv("ETL_WORKER_CHUNK_SIZE", "2000"))
+
+class PreparedSample(NamedTuple):
+    """A transformed sample with everything the order-dependent stages need, computed in a worker"""
+    sample: Dict[str, Any]
+    digest: bytes
+    band_hashes: Optional[List[int]]
+    rejection_reason: Optional[str]
+
+# Hash-only detectors reused across chunks in each worker process
+_worker_detectors: Dict[Tuple[Tuple[str, Any], ...], NearDuplicateDetector] = {}
+
+def _worker_detector(config: Dict[str, Any]) -> NearDuplicateDetector:
+    key = tuple(sorted(config.items()))
+    if key not in _worker_detectors:
+        # Workers only compute band hashes, so the bucket tables can be minimal
+        _worker_detectors[key] = NearDuplicateDetector(**config, num_buckets=1)
+    return _worker_detectors[key]
+
+def prepare_chunk(interactions: List[Dict[str, Any]],
+                  near_duplicate_config: Optional[Dict[str, Any]] = None) -> List[PreparedSample]:
+    """Transform one chunk and compute its digests, band hashes and content filter reason codes"""
+    detector = _worker_detector(near_duplicate_config) if near_duplicate_config else None
+    prepared: List[PreparedSample] = []
+    for sample in DataETLPipeline.iter_transform_for_training(interactions):
+        band_hashes = None
+        if detector is not None:
+            band_hashes = detector.band_hashes(DataQualityAssurance.near_duplicate_text(sample))
+        prepared.append(PreparedSample(
+            sample,
+            DataQualityAssurance.sample_digest(sample),
+            band_hashes,
+            DataQualityAssurance.rejection_reason(sample)
+        ))
+    return prepared
+
+class ParallelETLRunner:
+    """
+    Shard candidates into contiguous chunks and run the per-row stages (transform, hashing,
+    content screening) in a process pool. Chunks are merged back in input order and the
+    stages that depend on earlier rows (deduplication and domain caps) run in the parent,
+    so the output matches a single-process run exactly.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: Optional[int] = None,
+                 near_duplicates: Optional[NearDuplicateDetector] = None):
+        self.workers = workers or ETL_WORKERS
+        self.chunk_size = chunk_size or ETL_WORKER_CHUNK_SIZE
+        self.near_duplicates = near_duplicates
+
+    def iter_prepared(self, interactions: Iterable[Dict[str, Any]]) -> Iterator[PreparedSample]:
+        """Prepared samples in input order; at most two chunks per worker are in flight"""
+        config = self.near_duplicates.hash_config() if self.near_duplicates is not None else None
+        rows = iter(interactions)
+        # spawn keeps workers free of the parent's threads and open connections
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        pending: Deque["Future[List[PreparedSample]]"] = deque()
+        try:
+            while True:
+                while len(pending) < self.workers * 2:
+                    chunk = list(islice(rows, self.chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(prepare_chunk, chunk, config))
+                if not pending:
+                    return
+                yield from pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def iter_unique(prepared: Iterable[PreparedSample]) -> Iterator[PreparedSample]:
+        """Drop exact duplicates using the digests computed by the workers"""
+        seen: set[bytes] = set()
+        for item in prepared:
+            if item.digest not in seen:
+                seen.add(item.digest)
+                yield item
+
+    def iter_near_unique(self, prepared: Iterable[PreparedSample]) -> Iterator[PreparedSample]:
+        """Drop near-duplicates using the band hashes computed by the workers"""
+        for item in prepared:
+            if self.near_duplicates is None or item.band_hashes is None:
+                yield item
+            elif not self.near_duplicates.check_and_add(item.band_hashes):
+                yield item
+
+    @staticmethod
+    def iter_appropriate(prepared: Iterable[PreparedSample],
+                         on_reject: Optional[Callable[[Dict[str, Any], str], None]] = None) -> Iterator[PreparedSample]:
+        """Drop samples the workers' content filter rejected"""
+        for item in prepared:
+            if item.rejection_reason is None:
+                yield item
+            elif on_reject is not None:
+                on_reject(item.sample, item.rejection_reason)
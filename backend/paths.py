@@ -0,0 +1,13 @@
+# Filesystem Paths for Kalimtak
+import os
+
+# Relative paths in settings resolve against the backend directory, not the working directory
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def resolve_path(path: str) -> str:
+    """Absolute path, taking a relative one as relative to the backend directory"""
+    return os.path.normpath(os.path.join(BACKEND_DIR, os.path.expanduser(path)))
+
+def env_path(name: str, default: str) -> str:
+    """Path setting from the environment, resolved like resolve_path"""
+    return resolve_path(os.getenv(name) or default)
@@ -0,0 +1,53 @@
+# Request Coalescing for Kalimtak Generation Calls
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar('T')
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers that use the same key"""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+        # Counters reported through stats()
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """
+        Await fn() once per key; concurrent callers with the same key share its result.
+        Each caller applies its own timeout without cancelling the shared call.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def _forget(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        """Drop a finished call so the next request for the key starts a new one"""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved when every waiter has already timed out
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """In-flight and coalescing counters"""
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts
+        }
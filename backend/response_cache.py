@@ -0,0 +1,105 @@
+# Response Cache for Kalimtak Structured Prompts
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# (normalized text, target tool, language, model version)
+CacheKey = Tuple[str, str, str, str]
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different inputs share an entry"""
+    return " ".join(text.split()).casefold()
+
+class ResponseCache:
+    """Bounded LRU cache with TTL for generated structured prompts"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+        self._entries: "OrderedDict[CacheKey, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters reported through stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(text: str, target_tool: str, language: str, model_version: str) -> CacheKey:
+        """Build the cache key for a generation request"""
+        return (normalize_text(text), target_tool.strip().lower(), language.strip().lower(), model_version)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Return the cached prompt for key, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: CacheKey, value: str) -> None:
+        """Store a prompt, evicting the least recently used entries past the size bound"""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model_version: Optional[str] = None) -> int:
+        """Drop entries for a model version, or every entry when no version is given"""
+        with self._lock:
+            if model_version is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [key for key in self._entries if key[3] == model_version]
+                for key in stale:
+                    del self._entries[key]
+                removed = len(stale)
+            self.invalidations += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+# Singleton instance
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,89 @@
+# Stratified Sampling for Kalimtak Training Data
+import hashlib
+import heapq
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+TRAINING_SAMPLE_SEED = int(os.getenv("TRAINING_SAMPLE_SEED", "42"))
+
+Stratum = Tuple[Any, ...]
+
+def quality_bucket(quality_score: float) -> int:
+    """Feedback score (0-5) a normalized quality score came from"""
+    return int(round(quality_score * 5))
+
+def stratum_key(sample: Dict[str, Any]) -> Stratum:
+    """Domain, language and quality bucket of a training sample"""
+    metadata = sample["metadata"]
+    return (
+        metadata.get("domain", "general"),
+        metadata.get("language", "en"),
+        quality_bucket(metadata.get("quality_score", 0))
+    )
+
+def domain_key(sample: Dict[str, Any]) -> Stratum:
+    """Domain of a training sample"""
+    return (sample["metadata"].get("domain", "general"),)
+
+class StratifiedReservoirSampler:
+    """
+    One-pass sampler that keeps up to capacity samples per stratum.
+    Every sample gets a seeded hash priority and each stratum keeps its lowest priorities
+    (bottom-k sampling), so the selection is uniform within a stratum and depends only on
+    the seed and the set of samples, never on their order. Memory is capacity per stratum.
+    """
+
+    def __init__(self, capacity: int, key: Callable[[Dict[str, Any]], Stratum] = stratum_key,
+                 seed: Optional[int] = None):
+        self.capacity = capacity
+        self.key = key
+        self.seed = seed if seed is not None else TRAINING_SAMPLE_SEED
+        self._hash_key = str(self.seed).encode("utf-8")
+        # Per stratum, a max-heap of (-priority, sequence, sample): the root is evicted first
+        self._reservoirs: Dict[Stratum, List[Tuple[int, int, Dict[str, Any]]]] = {}
+        self._sequence = 0
+        self.seen: Dict[Stratum, int] = {}
+
+    def priority(self, sample: Dict[str, Any]) -> int:
+        """Seeded 64-bit priority of a sample's input and output"""
+        digest = hashlib.blake2b(digest_size=8, key=self._hash_key)
+        digest.update(sample["input"].encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(sample["output"].encode("utf-8"))
+        return int.from_bytes(digest.digest(), "big")
+
+    def add(self, sample: Dict[str, Any]) -> None:
+        """Offer one sample to its stratum's reservoir"""
+        stratum = self.key(sample)
+        self.seen[stratum] = self.seen.get(stratum, 0) + 1
+        if self.capacity <= 0:
+            return
+
+        reservoir = self._reservoirs.setdefault(stratum, [])
+        entry = (-self.priority(sample), self._sequence, sample)
+        self._sequence += 1
+        if len(reservoir) < self.capacity:
+            heapq.heappush(reservoir, entry)
+        elif entry > reservoir[0]:
+            # Lower priority than the highest one kept, so it takes that slot
+            heapq.heapreplace(reservoir, entry)
+
+    def samples(self) -> List[Dict[str, Any]]:
+        """Kept samples from every stratum, ordered by priority"""
+        entries = [entry for reservoir in self._reservoirs.values() for entry in reservoir]
+        entries.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [sample for _, _, sample in entries]
+
+    def iter_sample(self, samples: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Consume a stream, then yield the stratified sample"""
+        for sample in samples:
+            self.add(sample)
+        yield from self.samples()
+
+    def stats(self) -> Dict[str, Any]:
+        """Strata and sample counts"""
+        return {
+            "strata": len(self.seen),
+            "seen": sum(self.seen.values()),
+            "kept": sum(len(reservoir) for reservoir in self._reservoirs.values())
+        }
@@ -1,24 +1,31 @@
 # Scheduler for Kalimtak Continuous Learning Tasks
-import time
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from model_training import ModelTrainingOrchestrator
-from database import SupabaseService
+from storage import StorageBackend
+from curation import TrainingDataCurator
+
+# Watermark names holding each task's last run time
+SCHEDULER_WATERMARK_PREFIX = "scheduler:"
+NEVER = datetime.min.replace(tzinfo=timezone.utc)
 
 class TaskScheduler:
     """Schedule and run continuous learning tasks"""
     
-    def __init__(self, db_service: SupabaseService):
+    def __init__(self, db_service: StorageBackend):
         self.db_service = db_service
         self.training_orchestrator = ModelTrainingOrchestrator(db_service)
+        self.curator = TrainingDataCurator(db_service)
         self.running = False
         self.thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
     
     def start(self) -> None:
         """Start the scheduler"""
         if not self.running:
             self.running = True
+            self._wake.clear()
             self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
             self.thread.start()
             print("Task scheduler started")
@@ -26,49 +33,64 @@ class TaskScheduler:
     def stop(self) -> None:
         """Stop the scheduler"""
         self.running = False
+        self._wake.set()
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=5)  # Wait up to 5 seconds for thread to finish
         print("Task scheduler stopped")
     
+    def _last_run(self, task: str) -> datetime:
+        """When a task last completed, from its watermark; a task that never ran is due now"""
+        try:
+            position = self.db_service.get_watermark(f"{SCHEDULER_WATERMARK_PREFIX}{task}")
+        except Exception as e:
+            print(f"Error reading last {task} run, running it now: {e}")
+            position = None
+        return datetime.fromisoformat(position[0]) if position else NEVER
+
+    def _record_run(self, task: str, when: datetime) -> None:
+        """Persist a task's run time so restarts keep its schedule"""
+        self.db_service.save_watermark(f"{SCHEDULER_WATERMARK_PREFIX}{task}", when.isoformat(), task)
+
     def _run_scheduler(self) -> None:
         """Main scheduler loop"""
-        # Track last run times for each task
-        last_daily = datetime.now() - timedelta(days=1)
-        last_weekly = datetime.now() - timedelta(weeks=1)
-        last_monthly = datetime.now() - timedelta(weeks=4)
+        # Last run times are persisted, so a process that restarts often still runs every task on schedule
+        last_daily = self._last_run("daily")
+        last_weekly = self._last_run("weekly")
+        last_monthly = self._last_run("monthly")
         
         while self.running:
-            now = datetime.now()
+            now = datetime.now(timezone.utc)
             
             # Daily tasks (data curation)
             if now - last_daily >= timedelta(days=1):
                 print(f"[{now}] Running daily data curation task...")
                 self._run_daily_task()
                 last_daily = now
+                self._record_run("daily", now)
             
             # Weekly tasks (model fine-tuning)
             if now - last_weekly >= timedelta(weeks=1):
                 print(f"[{now}] Running weekly model fine-tuning task...")
                 self._run_weekly_task()
                 last_weekly = now
+                self._record_run("weekly", now)
             
             # Monthly tasks (comprehensive evaluation)
             if now - last_monthly >= timedelta(weeks=4):
                 print(f"[{now}] Running monthly evaluation task...")
                 self._run_monthly_task()
                 last_monthly = now
+                self._record_run("monthly", now)
             
-            # Sleep for an hour before checking again
-            time.sleep(3600)  # 1 hour
+            # Sleep for an hour before checking again, waking early on stop
+            self._wake.wait(3600)  # 1 hour
     
     def _run_daily_task(self) -> None:
         """Run daily data curation task"""
         try:
-            # This would trigger the admin endpoint to curate training data
-            # For now, we'll simulate the process
             print("Curating high-quality interactions for training...")
-            # In a real implementation, this would call the API endpoint
-            # or directly use the database service
+            curated_count = self.curator.curate()
+            print(f"Curated {curated_count} training data items")
         except Exception as e:
             print(f"Error in daily task: {e}")
     
@@ -92,14 +114,14 @@ class TaskScheduler:
 # Singleton instance
 _scheduler: Optional[TaskScheduler] = None
 
-def get_scheduler(db_service: SupabaseService) -> TaskScheduler:
+def get_scheduler(db_service: StorageBackend) -> TaskScheduler:
     """Get the singleton scheduler instance"""
     global _scheduler
     if _scheduler is None:
         _scheduler = TaskScheduler(db_service)
     return _scheduler
 
-def start_scheduler(db_service: SupabaseService) -> None:
+def start_scheduler(db_service: StorageBackend) -> None:
     """Start the scheduler"""
     scheduler = get_scheduler(db_service)
     scheduler.start()
@@ -108,4 +130,5 @@ def stop_scheduler() -> None:
     """Stop the scheduler"""
     global _scheduler
     if _scheduler:
-        _scheduler.stop()
\ No newline at end of file
+        _scheduler.stop()
+        _scheduler = None
\ No newline at end of file
@@ -0,0 +1,272 @@
+# Local SQLite Storage for Kalimtak
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from database import (
+    HISTORY_COLUMNS, TRAINING_DATA_CHUNK_SIZE, decode_cursor, _interaction_to_row, _training_item_to_row, _feedback_update, _history_page
+)
+from models import UserInteraction, TrainingDataItem
+from storage import StorageBackend, CANDIDATE_COLUMNS, CANDIDATE_PAGE_SIZE, InvalidCursor
+from paths import env_path
+
+INTERACTION_COLUMNS = list(UserInteraction.model_fields)
+TRAINING_DATA_COLUMNS = list(TrainingDataItem.model_fields)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_interactions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    session_id TEXT,
+    input_text TEXT,
+    structured_prompt TEXT,
+    model_output TEXT,
+    tokens_input INTEGER,
+    tokens_output INTEGER,
+    tokens_total INTEGER,
+    processing_time_ms INTEGER,
+    model_version TEXT,
+    target_tool TEXT,
+    language TEXT,
+    feedback_score INTEGER,
+    feedback_text TEXT,
+    ip_address TEXT,
+    user_agent TEXT,
+    cache_hit INTEGER DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_user_interactions_user_created
+    ON user_interactions (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_interactions_candidates
+    ON user_interactions (created_at, id) WHERE feedback_score >= 4;
+CREATE INDEX IF NOT EXISTS idx_user_interactions_candidates_updated
+    ON user_interactions (updated_at, id) WHERE feedback_score >= 4;
+
+CREATE TABLE IF NOT EXISTS training_data (
+    id TEXT PRIMARY KEY,
+    source_interaction_id TEXT,
+    input_prompt TEXT,
+    target_output TEXT,
+    quality_score REAL,
+    domain_category TEXT,
+    use_case TEXT,
+    is_curated INTEGER,
+    is_selected INTEGER,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_training_data_source
+    ON training_data (source_interaction_id);
+
+CREATE TABLE IF NOT EXISTS etl_watermarks (
+    name TEXT PRIMARY KEY,
+    cursor_value TEXT,
+    cursor_id TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS model_versions (
+    version TEXT PRIMARY KEY,
+    base_model TEXT,
+    training_dataset_id TEXT,
+    performance_metrics TEXT,
+    deployment_status TEXT,
+    deployed_at TEXT,
+    created_at TEXT
+);
+"""
+
+class SQLiteStorage(StorageBackend):
+    """
+    Storage backend on a local SQLite file in WAL mode, so readers never wait for the writer.
+    Each thread gets its own connection.
+    """
+
+    def __init__(self, path: Optional[str] = None, busy_timeout_ms: int = 5000):
+        self.path = path or env_path("SQLITE_DB_PATH", "kalimtak.db")
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the calling thread's connection, opening it on first use"""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Close every connection opened by this backend"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def log_user_interaction(self, interaction: UserInteraction) -> bool:
+        """Store a single interaction"""
+        return self.log_user_interactions([interaction])
+
+    def log_user_interactions(self, interactions: List[UserInteraction]) -> bool:
+        """Store several interactions in one transaction, ignoring ids that already exist"""
+        if not interactions:
+            return True
+        try:
+            rows = [_interaction_to_row(interaction) for interaction in interactions]
+            placeholders = ",".join("?" for _ in INTERACTION_COLUMNS)
+            with self._connection() as conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO user_interactions ({','.join(INTERACTION_COLUMNS)}) VALUES ({placeholders})",
+                    [[row.get(column) for column in INTERACTION_COLUMNS] for row in rows]
+                )
+            return True
+        except Exception as e:
+            print(f"Error logging {len(interactions)} interactions: {e}")
+            return False
+
+    def get_user_history(self, user_id: str, limit: int = 50,
+                         cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch one page of a user's interactions, newest first, with the cursor of the next page"""
+        try:
+            sql = f"SELECT {HISTORY_COLUMNS} FROM user_interactions WHERE user_id = ?"
+            params: List[Any] = [user_id]
+            if cursor:
+                created_at, row_id = decode_cursor(cursor)
+                sql += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+                params += [created_at, created_at, row_id]
+            sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+            params.append(limit + 1)
+
+            return _history_page([dict(row) for row in self._connection().execute(sql, params)], limit)
+        except InvalidCursor:
+            raise
+        except Exception as e:
+            print(f"Error fetching user history: {e}")
+            return [], None
+
+    def update_interaction_feedback(self, interaction_id: str, score: int, feedback_text: Optional[str] = None) -> bool:
+        """Record user feedback on an interaction"""
+        try:
+            update_data = _feedback_update(score, feedback_text)
+            assignments = ",".join(f"{column} = ?" for column in update_data)
+            with self._connection() as conn:
+                conn.execute(
+                    f"UPDATE user_interactions SET {assignments} WHERE id = ?",
+                    [*update_data.values(), interaction_id]
+                )
+            return True
+        except Exception as e:
+            print(f"Error updating interaction feedback: {e}")
+            return False
+
+    def iter_training_data_candidates(self, page_size: Optional[int] = None, columns: str = CANDIDATE_COLUMNS,
+                                      cursor_column: str = "created_at",
+                                      after: Optional[Tuple[str, str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield high-quality interactions page by page, ordered by (cursor_column, id) and starting after `after`"""
+        page_size = page_size or CANDIDATE_PAGE_SIZE
+        while True:
+            sql = f"SELECT {columns} FROM user_interactions WHERE feedback_score >= 4"
+            params: List[Any] = []
+            if after:
+                sql += f" AND ({cursor_column} > ? OR ({cursor_column} = ? AND id > ?))"
+                params += [after[0], after[0], after[1]]
+            sql += f" ORDER BY {cursor_column}, id LIMIT ?"
+            params.append(page_size)
+            try:
+                rows = [dict(row) for row in self._connection().execute(sql, params)]
+            except Exception as e:
+                # Stopping quietly would look like the end of the data and let a partial run commit
+                print(f"Error fetching training candidates: {e}")
+                raise
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = (str(rows[-1][cursor_column]), str(rows[-1]["id"]))
+
+    def save_training_data_item(self, item: TrainingDataItem) -> bool:
+        """Store a curated training data item"""
+        try:
+            row = _training_item_to_row(item)
+            placeholders = ",".join("?" for _ in TRAINING_DATA_COLUMNS)
+            with self._connection() as conn:
+                conn.execute(
+                    f"INSERT INTO training_data ({','.join(TRAINING_DATA_COLUMNS)}) VALUES ({placeholders})",
+                    [row.get(column) for column in TRAINING_DATA_COLUMNS]
+                )
+            return True
+        except Exception as e:
+            print(f"Error saving training data: {e}")
+            return False
+
+    def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+        """Upsert curated items in chunks keyed on their id; returns how many were written"""
+        chunk_size = chunk_size or TRAINING_DATA_CHUNK_SIZE
+        placeholders = ",".join("?" for _ in TRAINING_DATA_COLUMNS)
+        saved = 0
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            try:
+                rows = [_training_item_to_row(item) for item in chunk]
+                with self._connection() as conn:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO training_data ({','.join(TRAINING_DATA_COLUMNS)}) VALUES ({placeholders})",
+                        [[row.get(column) for column in TRAINING_DATA_COLUMNS] for row in rows]
+                    )
+                saved += len(chunk)
+            except Exception as e:
+                print(f"Error saving {len(chunk)} training data items: {e}")
+        return saved
+
+    def get_watermark(self, name: str) -> Optional[Tuple[str, str]]:
+        """Get the (cursor value, id) position an incremental job last processed"""
+        try:
+            row = self._connection().execute(
+                "SELECT cursor_value, cursor_id FROM etl_watermarks WHERE name = ?", (name,)
+            ).fetchone()
+            return (str(row["cursor_value"]), str(row["cursor_id"])) if row else None
+        except Exception as e:
+            # Reporting "no watermark" here would make the job rescan the full history
+            print(f"Error fetching watermark {name}: {e}")
+            raise
+
+    def save_watermark(self, name: str, cursor_value: str, row_id: str) -> bool:
+        """Persist how far an incremental job has processed"""
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO etl_watermarks (name, cursor_value, cursor_id, updated_at) VALUES (?, ?, ?, ?)",
+                    (name, cursor_value, row_id, datetime.now(timezone.utc).isoformat())
+                )
+            return True
+        except Exception as e:
+            print(f"Error saving watermark {name}: {e}")
+            return False
+
+    def save_model_version(self, version: str, base_model: str, training_dataset_id: str,
+                           performance_metrics: Dict[str, Any]) -> bool:
+        """Record a trained model version"""
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO model_versions "
+                    "(version, base_model, training_dataset_id, performance_metrics, deployment_status, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (version, base_model, training_dataset_id, json.dumps(performance_metrics),
+                     "registered", datetime.now(timezone.utc).isoformat())
+                )
+            return True
+        except Exception as e:
+            print(f"Error saving model version: {e}")
+            return False
@@ -0,0 +1,173 @@
+# Pluggable Storage Backends for Kalimtak
+import asyncio
+import os
+import uuid
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from models import UserInteraction, TrainingDataItem
+
+# Rows per page when paging through training candidates
+CANDIDATE_PAGE_SIZE = int(os.getenv("TRAINING_CANDIDATE_PAGE_SIZE", "1000"))
+
+# Columns the ETL pipeline and curation read from a candidate interaction
+CANDIDATE_COLUMNS = "id,input_text,structured_prompt,feedback_score,target_tool,language,created_at,updated_at"
+
+# Namespace for training data ids derived from their source interaction
+TRAINING_DATA_NAMESPACE = uuid.UUID("5b0f8a52-6d1e-4c3f-9a47-1e2d3c4b5a69")
+
+# Producers of training data rows; each has its own id space, so their rows never overwrite each other
+CURATION_PRODUCER = "curation"
+DATASET_PRODUCER = "dataset"
+
+def training_data_item_id(source_key: str, producer: str) -> str:
+    """Deterministic training data id, so one producer handling the same interaction twice updates one row"""
+    return str(uuid.uuid5(uuid.uuid5(TRAINING_DATA_NAMESPACE, producer), source_key))
+
+class InvalidCursor(ValueError):
+    """A history cursor that was not produced by this service"""
+
+class StorageBackend(ABC):
+    """Interactions, feedback, training data and model versions behind one interface"""
+
+    @abstractmethod
+    def log_user_interaction(self, interaction: UserInteraction) -> bool:
+        """Store a single interaction"""
+
+    @abstractmethod
+    def log_user_interactions(self, interactions: List[UserInteraction]) -> bool:
+        """Store several interactions at once, ignoring ids that already exist"""
+
+    @abstractmethod
+    def get_user_history(self, user_id: str, limit: int = 50,
+                         cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Fetch one page of a user's interactions, newest first, with the cursor of the next page.
+        Raises InvalidCursor for a malformed cursor.
+        """
+
+    @abstractmethod
+    def update_interaction_feedback(self, interaction_id: str, score: int, feedback_text: Optional[str] = None) -> bool:
+        """Record user feedback on an interaction"""
+
+    @abstractmethod
+    def iter_training_data_candidates(self, page_size: Optional[int] = None, columns: str = CANDIDATE_COLUMNS,
+                                      cursor_column: str = "created_at",
+                                      after: Optional[Tuple[str, str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield high-quality interactions page by page, ordered by (cursor_column, id) and starting after `after`.
+        A failed page fetch raises, so a scan never ends early without notice.
+        """
+
+    def get_training_data_candidates(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Retrieve high-quality interactions for training data; empty if the read fails"""
+        try:
+            return list(islice(self.iter_training_data_candidates(page_size=min(limit, CANDIDATE_PAGE_SIZE)), limit))
+        except Exception:
+            return []
+
+    @abstractmethod
+    def save_training_data_item(self, item: TrainingDataItem) -> bool:
+        """Store a curated training data item"""
+
+    @abstractmethod
+    def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+        """Upsert curated items in chunks keyed on their id; returns how many were written"""
+
+    @abstractmethod
+    def get_watermark(self, name: str) -> Optional[Tuple[str, str]]:
+        """
+        Get the (cursor value, id) position an incremental job last processed.
+        None means the job has never run; a failed read raises instead.
+        """
+
+    @abstractmethod
+    def save_watermark(self, name: str, cursor_value: str, row_id: str) -> bool:
+        """Persist how far an incremental job has processed"""
+
+    @abstractmethod
+    def save_model_version(self, version: str, base_model: str, training_dataset_id: str,
+                           performance_metrics: Dict[str, Any]) -> bool:
+        """Record a trained model version"""
+
+class AsyncStorageBackend(ABC):
+    """Awaitable storage operations used by request handlers"""
+
+    async def connect(self) -> None:
+        """Open connections before serving requests"""
+
+    async def close(self) -> None:
+        """Release connections on shutdown"""
+
+    @abstractmethod
+    async def log_user_interactions(self, interactions: List[UserInteraction]) -> bool:
+        """Store several interactions at once, ignoring ids that already exist"""
+
+    @abstractmethod
+    async def get_user_history(self, user_id: str, limit: int = 50,
+                               cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Fetch one page of a user's interactions, newest first, with the cursor of the next page.
+        Raises InvalidCursor for a malformed cursor.
+        """
+
+    @abstractmethod
+    async def update_interaction_feedback(self, interaction_id: str, score: int,
+                                          feedback_text: Optional[str] = None) -> bool:
+        """Record user feedback on an interaction"""
+
+    @abstractmethod
+    async def get_training_data_candidates(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Retrieve high-quality interactions for training data"""
+
+    @abstractmethod
+    async def save_training_data_item(self, item: TrainingDataItem) -> bool:
+        """Store a curated training data item"""
+
+    @abstractmethod
+    async def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+        """Upsert curated items in chunks keyed on their id; returns how many were written"""
+
+class AsyncStorageAdapter(AsyncStorageBackend):
+    """Run a blocking storage backend in worker threads"""
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+
+    async def log_user_interactions(self, interactions: List[UserInteraction]) -> bool:
+        return await asyncio.to_thread(self.storage.log_user_interactions, interactions)
+
+    async def get_user_history(self, user_id: str, limit: int = 50,
+                               cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        return await asyncio.to_thread(self.storage.get_user_history, user_id, limit, cursor)
+
+    async def update_interaction_feedback(self, interaction_id: str, score: int,
+                                          feedback_text: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.storage.update_interaction_feedback, interaction_id, score, feedback_text)
+
+    async def get_training_data_candidates(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.storage.get_training_data_candidates, limit)
+
+    async def save_training_data_item(self, item: TrainingDataItem) -> bool:
+        return await asyncio.to_thread(self.storage.save_training_data_item, item)
+
+    async def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+        return await asyncio.to_thread(self.storage.save_training_data_items, items, chunk_size)
+
+def create_storage_backend(kind: Optional[str] = None) -> StorageBackend:
+    """Create the storage backend selected by STORAGE_BACKEND (supabase or sqlite)"""
+    kind = (kind or os.getenv("STORAGE_BACKEND", "supabase")).lower()
+    if kind == "supabase":
+        from database import SupabaseService
+        return SupabaseService()
+    if kind == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage()
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+def create_async_storage_backend(storage: StorageBackend) -> AsyncStorageBackend:
+    """Create the awaitable counterpart of a storage backend"""
+    from database import SupabaseService, AsyncSupabaseService
+    if isinstance(storage, SupabaseService):
+        return AsyncSupabaseService()
+    return AsyncStorageAdapter(storage)
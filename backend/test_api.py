@@ -24,6 +24,28 @@ def test_generate_prompt():
         print(f"Error: {e}")
         return False
 
+def test_generate_prompt_batch():
+    """Test the /api/generate/batch endpoint"""
+    url = "http://localhost:8000/api/generate/batch"
+    headers = {"Content-Type": "application/json"}
+    
+    # Test data
+    payload = {
+        "items": [
+            {"text": "Create a Python script that sorts a list of numbers", "target_tool": "code generation"},
+            {"text": "Summarize this article in three bullet points", "language": "en"}
+        ]
+    }
+    
+    try:
+        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.json()}")
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
 def test_get_history():
     """Test the /api/history endpoint"""
     url = "http://localhost:8000/api/history/test_user_123"
@@ -42,7 +64,10 @@ if __name__ == "__main__":
     print("\n1. Testing generate prompt endpoint:")
     test_generate_prompt()
     
-    print("\n2. Testing history endpoint:")
+    print("\n2. Testing batch generate endpoint:")
+    test_generate_prompt_batch()
+    
+    print("\n3. Testing history endpoint:")
     test_get_history()
     
     print("\nAPI tests completed!")
\ No newline at end of file
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Test script for the Kalimtak API
+This script runs the FastAPI app in-process on a throwaway SQLite database, without a live server.
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(__file__))
+
+@contextmanager
+def app_environment() -> Iterator[str]:
+    """Point the app at SQLite storage and a temporary spool and dataset root; yields the database path"""
+    import dataset_writer
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        db_path = os.path.join(data_dir, "kalimtak.db")
+        env = {
+            "STORAGE_BACKEND": "sqlite",
+            "SQLITE_DB_PATH": db_path,
+            "INTERACTION_SPOOL_DIR": os.path.join(data_dir, "spool")
+        }
+        previous_env = {name: os.environ.get(name) for name in env}
+        previous_root = dataset_writer.TRAINING_DATA_DIR
+        os.environ.update(env)
+        # The scheduler's startup run writes a dataset; keep it out of ai/training_data
+        dataset_writer.TRAINING_DATA_DIR = os.path.join(data_dir, "datasets")
+        try:
+            yield db_path
+        finally:
+            dataset_writer.TRAINING_DATA_DIR = previous_root
+            for name, value in previous_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+def logged_history(db_path: str, user_id: str) -> List[Dict[str, Any]]:
+    """Interactions the app logged for a user, read after shutdown has flushed the logger"""
+    from sqlite_storage import SQLiteStorage
+
+    storage = SQLiteStorage(path=db_path)
+    rows, _ = storage.get_user_history(user_id, limit=200)
+    storage.close()
+    return rows
+
+def seed_interactions(db_path: str, user_id: str, count: int) -> List[str]:
+    """Store count well-rated interactions for a user a minute apart; returns their ids, oldest first"""
+    from models import UserInteraction
+    from sqlite_storage import SQLiteStorage
+
+    base_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    interactions = [
+        UserInteraction(
+            id=f"{user_id}-{i}",
+            user_id=user_id,
+            input_text=f"Seeded input {i}",
+            structured_prompt=f"Seeded structured prompt {i}",
+            model_output=f"Seeded output {i}",
+            tokens_total=3,
+            feedback_score=5,
+            created_at=base_time + timedelta(minutes=i),
+            updated_at=base_time + timedelta(minutes=i)
+        )
+        for i in range(count)
+    ]
+    storage = SQLiteStorage(path=db_path)
+    storage.log_user_interactions(interactions)
+    storage.close()
+    return [interaction.id for interaction in interactions]
+
+def parse_events(body: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """(event name, data) of every server-sent event in a response body"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        name = "message"
+        data = ""
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                name = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = line[len("data: "):]
+        events.append((name, json.loads(data)))
+    return events
+
+class PassthroughTemplate:
+    """Prompt template stub that sends the input text as the prompt"""
+
+    def format(self, **kwargs: str) -> str:
+        return kwargs["input_text"]
+
+class BrokenStreamLLM:
+    """LLM stub that streams some chunks and then fails"""
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from self.chunks
+        raise RuntimeError("connection reset")
+
+def break_streaming(app: Any, chunks: List[str]) -> None:
+    """Make every pooled orchestrator fail after streaming the given chunks"""
+    for orchestrator in app.get_orchestrator_pool()._instances:
+        orchestrator.llm = BrokenStreamLLM(chunks)
+        orchestrator.prompt_template = PassthroughTemplate()
+        orchestrator.chain = object()
+
+def test_stream_tokens_and_errors():
+    """Test that streamed prompts count tokens like /api/generate and partial prompts are never logged"""
+    print("Testing streaming endpoint...")
+
+    import app
+    from ai_service import fallback_prompt
+    from fastapi.testclient import TestClient
+
+    request = {"text": "Stream a sorting prompt", "target_tool": "code", "language": "en"}
+    with app_environment() as db_path:
+        with TestClient(app.app) as client:
+            events = parse_events(client.post("/api/generate/stream", json={**request, "user_id": "streamed"}).text)
+            prompt = "".join(data["delta"] for name, data in events if "delta" in data)
+            name, summary = events[-1]
+            assert name == "message" and summary["done"]
+            assert summary["tokens_used"] == len(prompt.split())
+            print(f"✓ Streamed prompt counts {summary['tokens_used']} words")
+
+            break_streaming(app, [])
+            events = parse_events(client.post("/api/generate/stream", json={**request, "user_id": "fallback"}).text)
+            fallback = fallback_prompt(request["text"], request["target_tool"], request["language"])
+            assert [data["delta"] for _, data in events[:-1]] == [fallback]
+            assert events[-1][1]["tokens_used"] == len(fallback.split())
+            print(f"✓ Fallback counts {len(fallback.split())} words, not one chunk")
+
+            break_streaming(app, ["Partial ", "prompt "])
+            events = parse_events(client.post("/api/generate/stream", json={**request, "user_id": "broken"}).text)
+            assert [data["delta"] for _, data in events[:-1]] == ["Partial ", "prompt "]
+            name, error = events[-1]
+            assert name == "error" and error["error"] == "Prompt generation failed"
+            assert not any(data.get("done") for _, data in events)
+            print("✓ Mid-stream failure ends with an error event")
+
+        input_words = len(request["text"].split())
+        assert [row["tokens_total"] for row in logged_history(db_path, "streamed")] == [input_words + summary["tokens_used"]]
+        assert len(logged_history(db_path, "fallback")) == 1
+        assert logged_history(db_path, "broken") == []
+        print("✓ Complete prompts logged, the partial one is not")
+
+    return True
+
+def test_batch_endpoint():
+    """Test that a batch answers every item in order and logs each one"""
+    print("\nTesting batch endpoint...")
+
+    import app
+    from fastapi.testclient import TestClient
+
+    items = [{"text": f"Batch input {i}", "target_tool": "code", "user_id": "batched"} for i in range(3)]
+    with app_environment() as db_path:
+        with TestClient(app.app) as client:
+            response = client.post("/api/generate/batch", json={"items": items})
+            assert response.status_code == 200
+            body = response.json()
+            assert body["succeeded"] == 3 and body["failed"] == 0
+            assert [result["index"] for result in body["results"]] == [0, 1, 2]
+            for result in body["results"]:
+                assert result["status"] == "success"
+                assert result["result"]["tokens_used"] == len(result["result"]["structured_prompt"].split())
+            print(f"✓ Batch of {len(items)} answered in order")
+
+            previous_max_items = app.BATCH_MAX_ITEMS
+            app.BATCH_MAX_ITEMS = 2
+            try:
+                assert client.post("/api/generate/batch", json={"items": items}).status_code == 413
+            finally:
+                app.BATCH_MAX_ITEMS = previous_max_items
+            print("✓ Oversized batch rejected with 413")
+
+        assert len(logged_history(db_path, "batched")) == 3
+        print("✓ Every batch item logged")
+
+    return True
+
+def test_history_pagination():
+    """Test that history pages follow the X-Next-Cursor header newest first"""
+    print("\nTesting paginated history...")
+
+    import app
+    from fastapi.testclient import TestClient
+
+    with app_environment() as db_path:
+        ids = seed_interactions(db_path, "paged", 5)
+        with TestClient(app.app) as client:
+            pages = []
+            cursor = None
+            while True:
+                params: Dict[str, Any] = {"limit": 2}
+                if cursor:
+                    params["cursor"] = cursor
+                response = client.get("/api/history/paged", params=params)
+                assert response.status_code == 200
+                pages.append([item["id"] for item in response.json()])
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            assert [len(page) for page in pages] == [2, 2, 1]
+            assert [item_id for page in pages for item_id in page] == ids[::-1]
+            print(f"✓ {len(ids)} interactions in pages of {[len(page) for page in pages]}")
+
+            assert client.get("/api/history/paged", params={"cursor": "not-a-cursor"}).status_code == 400
+            assert client.get("/api/history/paged", params={"limit": 0}).status_code == 422
+            print("✓ Bad cursors and limits rejected")
+
+    return True
+
+def test_curation_job_endpoints():
+    """Test that curation is accepted as a job whose progress can be polled"""
+    print("\nTesting curation job endpoints...")
+
+    import app
+    from fastapi.testclient import TestClient
+    from scheduler import SCHEDULER_WATERMARK_PREFIX
+    from sqlite_storage import SQLiteStorage
+    from storage import CURATION_PRODUCER, training_data_item_id
+
+    with app_environment() as db_path:
+        ids = seed_interactions(db_path, "curated", 4)
+        # Mark the scheduled curation as just run, so the job is the one that curates
+        storage = SQLiteStorage(path=db_path)
+        storage.save_watermark(f"{SCHEDULER_WATERMARK_PREFIX}daily", datetime.now(timezone.utc).isoformat(), "daily")
+        storage.close()
+        with TestClient(app.app) as client:
+            response = client.post("/api/admin/curate-training-data")
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+
+            deadline = time.time() + 10
+            status = client.get(f"/api/admin/curation-jobs/{job_id}").json()
+            while status["status"] in ("queued", "running") and time.time() < deadline:
+                time.sleep(0.05)
+                status = client.get(f"/api/admin/curation-jobs/{job_id}").json()
+            assert status["status"] == "succeeded"
+            assert status["scanned"] == status["curated"] == len(ids) and status["failed"] == 0
+            print(f"✓ Curation job {status['status']}: {status['scanned']} scanned")
+
+            assert client.get("/api/admin/curation-jobs/unknown").status_code == 404
+            print("✓ Unknown job returns 404")
+
+        conn = sqlite3.connect(db_path)
+        curated = {row[0] for row in conn.execute("SELECT id FROM training_data WHERE is_curated = 1")}
+        conn.close()
+        assert {training_data_item_id(item_id, CURATION_PRODUCER) for item_id in ids} <= curated
+        print(f"✓ All {len(ids)} interactions curated")
+
+    return True
+
+def main():
+    """Run API tests"""
+    print("Kalimtak API Test Suite")
+    print("=" * 50)
+
+    tests = [
+        test_stream_tokens_and_errors,
+        test_batch_endpoint,
+        test_history_pagination,
+        test_curation_job_endpoints
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ Test {test.__name__} failed with exception: {e}")
+            failed += 1
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+
+    if failed == 0:
+        print("🎉 All tests passed! The API is working correctly.")
+        return 0
+    else:
+        print("❌ Some tests failed. Please check the implementation.")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
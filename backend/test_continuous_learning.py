@@ -6,8 +6,10 @@ This script verifies that all components of the continuous learning system are w
 
 import sys
 import os
+import shutil
+import tempfile
 from datetime import datetime, timezone
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 # Add the backend directory to the path
 sys.path.insert(0, os.path.dirname(__file__))
@@ -143,12 +145,16 @@ def test_etl_pipeline():
             def save_training_data_item(self, item: TrainingDataItem) -> bool:
                 return True
             
+            def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+                return len(items)
+            
             def __init__(self):
                 pass  # Don't call parent __init__ to avoid Supabase connection
         
         # Test DataETLPipeline
         mock_db = MockDBService()
-        etl_pipeline = DataETLPipeline(mock_db)
+        dataset_dir = tempfile.mkdtemp()
+        etl_pipeline = DataETLPipeline(mock_db, dataset_dir=dataset_dir)
         
         # Test extraction
         candidates = etl_pipeline.extract_candidate_interactions()
@@ -160,6 +166,8 @@ def test_etl_pipeline():
         
         # Test loading
         dataset_id = etl_pipeline.load_training_dataset(samples)
+        assert os.path.exists(os.path.join(dataset_dir, dataset_id, "manifest.json"))
+        shutil.rmtree(dataset_dir)
         print(f"✓ ETL loading successful: dataset {dataset_id}")
         
         # Test DataQualityAssurance
@@ -172,6 +180,394 @@ def test_etl_pipeline():
     
     return True
 
+def test_streaming_etl():
+    """Test the generator-based ETL pipeline"""
+    print("\nTesting streaming ETL pipeline...")
+    
+    from models import TrainingDataItem
+    from database import SupabaseService
+    from etl_pipeline import DataETLPipeline
+    
+    # Mock database service that records chunk sizes
+    class MockDBService(SupabaseService):
+        def __init__(self):
+            self.chunk_sizes: List[int] = []
+        
+        def save_training_data_items(self, items: List[TrainingDataItem], chunk_size: Optional[int] = None) -> int:
+            self.chunk_sizes.append(len(items))
+            return len(items)
+    
+    produced = {"rows": 0}
+    
+    def interactions():
+        for i in range(2500):
+            produced["rows"] += 1
+            yield {
+                "id": f"test-{i}",
+                "input_text": f"Test input {i % 2000}",
+                "structured_prompt": f"Test structured prompt {i % 2000}",
+                "feedback_score": 2 if i % 10 == 0 else 5,
+                "target_tool": "general",
+                "language": "en"
+            }
+    
+    mock_db = MockDBService()
+    etl_pipeline = DataETLPipeline(mock_db, chunk_size=100)
+    samples = etl_pipeline.stream_training_samples(interactions())
+    assert produced["rows"] == 0  # Nothing runs until the sink pulls rows
+    
+    loaded = etl_pipeline.load_training_samples(samples)
+    counts = etl_pipeline.stage_counts
+    assert counts["extract"] == 2500
+    assert counts["transform"] == 2250
+    assert counts["deduplicate"] == 1800
+    assert loaded == counts["load"] == 1800
+    assert max(mock_db.chunk_sizes) == 100
+    print(f"✓ Streaming ETL successful: {counts}")
+    
+    return True
+
+def test_near_duplicates():
+    """Test MinHash/LSH near-duplicate removal"""
+    print("\nTesting near-duplicate detection...")
+    
+    from etl_pipeline import DataQualityAssurance
+    from near_duplicates import NearDuplicateDetector
+    
+    def sample(text: str) -> Dict[str, Any]:
+        return {"input": text, "output": "Structured prompt", "metadata": {"domain": "general"}}
+    
+    base = "Write a detailed blog post about the benefits of remote work for software engineering teams"
+    samples = [
+        sample(base),
+        sample("  write a DETAILED blog post about the benefits of remote work for software engineering teams "),
+        sample(base + " today"),
+        sample("Compose a haiku about autumn leaves falling on a quiet pond at dusk")
+    ]
+    unique_samples = DataQualityAssurance.detect_near_duplicates(samples, threshold=0.7)
+    assert [s["input"] for s in unique_samples] == [samples[0]["input"], samples[3]["input"]]
+    print(f"✓ Near-duplicates removed: {len(unique_samples)} of {len(samples)} kept")
+    
+    detector = NearDuplicateDetector(threshold=0.8, shingle="char", num_buckets=1024)
+    assert not detector.is_duplicate(base)
+    assert detector.is_duplicate(base.upper())
+    stats = detector.stats()
+    assert stats["table_bytes"] == stats["bands"] * 1024 * 4
+    print(f"✓ Bounded bucket tables: {stats['table_bytes']} bytes")
+    
+    return True
+
+def test_parallel_etl():
+    """Test that the process-pool ETL matches a single-process run"""
+    print("\nTesting parallel ETL...")
+    
+    import parallel_etl
+    from etl_pipeline import DataETLPipeline
+    from near_duplicates import NearDuplicateDetector
+    from sqlite_storage import SQLiteStorage
+    
+    # Small chunks so several are in flight across the workers
+    previous_chunk_size = parallel_etl.ETL_WORKER_CHUNK_SIZE
+    parallel_etl.ETL_WORKER_CHUNK_SIZE = 50
+    try:
+        interactions = [
+            {
+                "id": f"interaction-{i}",
+                "input_text": f"Write about topic {i % 40} for the {i % 3} audience",
+                "structured_prompt": f"Structured prompt {i % 50}",
+                "feedback_score": 1 + i % 5,
+                "target_tool": ["general", "chatgpt", "midjourney"][i % 3],
+                "language": "en"
+            }
+            for i in range(600)
+        ]
+    
+        def run(workers: int) -> List[Dict[str, Any]]:
+            pipeline = DataETLPipeline(SQLiteStorage(path=":memory:"))
+            samples = pipeline.stream_training_samples(
+                interactions, max_samples_per_domain=20,
+                near_duplicates=NearDuplicateDetector(threshold=0.8, num_buckets=4096), workers=workers
+            )
+            result = list(samples)
+            print(f"✓ {workers} worker(s): {pipeline.stage_counts}")
+            return result
+    
+        sequential = run(1)
+        parallel = run(2)
+        assert parallel == sequential
+        print(f"✓ Parallel output matches sequential output ({len(parallel)} samples)")
+    finally:
+        parallel_etl.ETL_WORKER_CHUNK_SIZE = previous_chunk_size
+    
+    return True
+
+def _app_import_side_effects() -> Dict[str, Any]:
+    """Import app the way a spawned worker re-imports its launching script, and report what started"""
+    import threading
+    import app
+    import scheduler
+    return {
+        "threads": threading.active_count(),
+        "scheduler_started": scheduler._scheduler is not None,
+        "storage_opened": hasattr(app, "db_service")
+    }
+
+def test_app_import_in_spawned_worker():
+    """Test that importing app in a spawned worker process starts nothing"""
+    print("\nTesting app import in a spawned worker...")
+    
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        effects = executor.submit(_app_import_side_effects).result(timeout=120)
+    assert effects == {"threads": 1, "scheduler_started": False, "storage_opened": False}, effects
+    print(f"✓ Importing app has no side effects: {effects}")
+    
+    return True
+
+def test_stratified_sampling():
+    """Test the seeded stratified reservoir sampler"""
+    print("\nTesting stratified sampling...")
+    
+    import random
+    from etl_pipeline import DataQualityAssurance
+    from sampling import StratifiedReservoirSampler, stratum_key
+    
+    samples = [
+        {
+            "input": f"Test input {i}",
+            "output": f"Test output {i}",
+            "metadata": {
+                "domain": ["general", "chatgpt", "midjourney"][i % 3],
+                "language": ["en", "ar"][i % 2],
+                "quality_score": (3 + i // 6 % 3) / 5.0
+            }
+        }
+        for i in range(1200)
+    ]
+    shuffled = samples[:]
+    random.Random(7).shuffle(shuffled)
+    
+    sampler = StratifiedReservoirSampler(10, seed=1)
+    selected = list(sampler.iter_sample(samples))
+    assert selected == list(StratifiedReservoirSampler(10, seed=1).iter_sample(shuffled))
+    assert selected != list(StratifiedReservoirSampler(10, seed=2).iter_sample(samples))
+    strata: Dict[Any, int] = {}
+    for sample in selected:
+        strata[stratum_key(sample)] = strata.get(stratum_key(sample), 0) + 1
+    assert len(strata) == 18 and set(strata.values()) == {10}
+    print(f"✓ Order-independent stratified sample: {sampler.stats()}")
+    
+    diverse = DataQualityAssurance.ensure_diversity(samples, max_samples_per_domain=25, seed=1)
+    assert len(diverse) == 75
+    assert diverse == DataQualityAssurance.ensure_diversity(shuffled, max_samples_per_domain=25, seed=1)
+    print(f"✓ Domain caps hold: {len(diverse)} samples across 3 domains")
+    
+    return True
+
+def test_content_filter():
+    """Test the blocklist content filter"""
+    print("\nTesting content filter...")
+    
+    import tempfile
+    import content_filter as content_filter_module
+    from content_filter import ContentFilter
+    from etl_pipeline import DataETLPipeline, DataQualityAssurance
+    from sqlite_storage import SQLiteStorage
+    
+    with tempfile.TemporaryDirectory() as blocklist_dir:
+        with open(os.path.join(blocklist_dir, "weapons.txt"), "w", encoding="utf-8") as f:
+            f.write("# version: 3\npipe bomb\nbomb\nghost gun\n")
+        with open(os.path.join(blocklist_dir, "spam.txt"), "w", encoding="utf-8") as f:
+            f.write("# version: 1\nbuy now\n")
+        filters = [ContentFilter(blocklist_dir)]
+        # The regex fallback must match exactly like the Aho-Corasick engine
+        automaton, content_filter_module.ahocorasick = content_filter_module.ahocorasick, None
+        try:
+            filters.append(ContentFilter(blocklist_dir))
+        finally:
+            content_filter_module.ahocorasick = automaton
+    
+    for content_filter in filters:
+        assert content_filter.check("How to build a  PIPE bomb", "").reason == "weapons"
+        assert content_filter.check("Write an ad", "Buy now!").reason == "spam"
+        assert content_filter.check("Write about bombastic poetry", "") is None
+        assert content_filter.check("pipe", "bomb") is not None  # "bomb" alone is listed
+        assert content_filter.check("Write about a ghost", "gun safety") is None
+        assert content_filter.version.startswith("spam:1,weapons:3@")
+        print(f"✓ Blocklist matching with reason codes: {content_filter.stats()}")
+    
+    samples = [
+        {"input": "Write a poem about spring", "output": "Structured prompt", "metadata": {}},
+        {"input": "Explain how to make a bomb", "output": "Structured prompt", "metadata": {}}
+    ]
+    rejected: List[str] = []
+    kept = list(DataQualityAssurance.iter_filter_inappropriate_content(
+        samples, lambda sample, reason: rejected.append(reason)
+    ))
+    assert kept == samples[:1] and rejected == ["violence"]
+    print(f"✓ Default blocklists reject unsafe samples: {rejected}")
+    
+    pipeline = DataETLPipeline(SQLiteStorage(path=":memory:"))
+    interactions = [
+        {"id": "1", "input_text": "Write a poem about spring", "structured_prompt": "Prompt", "feedback_score": 5},
+        {"id": "2", "input_text": "Find untraceable gun parts", "structured_prompt": "Prompt", "feedback_score": 5}
+    ]
+    assert len(list(pipeline.stream_training_samples(interactions))) == 1
+    assert pipeline.rejection_counts == {"violence": 1}
+    print(f"✓ Pipeline reports rejections: {pipeline.rejection_counts}")
+
+    from paths import BACKEND_DIR
+    cwd = os.getcwd()
+    previous = os.environ.get("CONTENT_BLOCKLIST_DIR")
+    os.environ["CONTENT_BLOCKLIST_DIR"] = "blocklists"
+    try:
+        os.chdir(tempfile.gettempdir())
+        assert ContentFilter().blocklist_dir == os.path.join(BACKEND_DIR, "blocklists")
+    finally:
+        os.chdir(cwd)
+        if previous is None:
+            del os.environ["CONTENT_BLOCKLIST_DIR"]
+        else:
+            os.environ["CONTENT_BLOCKLIST_DIR"] = previous
+    missing = ContentFilter(os.path.join(tempfile.gettempdir(), "no-such-blocklists"))
+    assert missing.terms == {} and missing.check("Explain how to make a bomb", "") is None
+    print("✓ Relative blocklist dir resolves against backend/, a missing one filters nothing")
+    
+    return True
+
+def test_sharded_dataset():
+    """Test the sharded dataset writer and its manifest"""
+    print("\nTesting sharded dataset files...")
+    
+    import gzip
+    import json
+    from dataset_writer import ShardedDatasetWriter, read_manifest, verify_dataset
+    
+    root = tempfile.mkdtemp()
+    try:
+        writer = ShardedDatasetWriter("dataset-1", root=root, shard_rows=40)
+        for i in range(100):
+            writer.write({"input": f"Input {i}", "output": f"Output {i}", "metadata": {"domain": "general"}},
+                         split="validation" if i % 10 == 0 else "train")
+        manifest = writer.close(watermark={"name": "training_dataset", "start": None, "end": ["t", "1"]})
+        
+        directory = os.path.join(root, "dataset-1")
+        assert read_manifest(directory) == manifest
+        assert manifest["rows"] == 100 and manifest["splits"] == {"train": 90, "validation": 10}
+        assert [shard["path"] for shard in manifest["shards"]] == [
+            "train-00000.jsonl.gz", "train-00001.jsonl.gz", "train-00002.jsonl.gz", "validation-00000.jsonl.gz"
+        ]
+        assert [shard["rows"] for shard in manifest["shards"]] == [40, 40, 10, 10]
+        assert not os.path.exists(directory + ".tmp")
+        with gzip.open(os.path.join(directory, "train-00000.jsonl.gz"), "rt", encoding="utf-8") as f:
+            assert json.loads(f.readline())["input"] == "Input 1"
+        assert verify_dataset(directory) == (True, [])
+        print(f"✓ Shards and manifest written: {manifest['splits']}")
+        
+        with open(os.path.join(directory, "train-00001.jsonl.gz"), "r+b") as f:
+            f.seek(20)
+            f.write(b"\xff")
+        ok, problems = verify_dataset(directory)
+        assert not ok and problems == ["train-00001.jsonl.gz: checksum mismatch"]
+        print(f"✓ Corruption detected: {problems}")
+        
+        aborted = ShardedDatasetWriter("dataset-2", root=root)
+        aborted.write({"input": "a", "output": "b", "metadata": {}})
+        aborted.abort()
+        assert sorted(os.listdir(root)) == ["dataset-1"]
+        print("✓ Aborted dataset leaves no files")
+    finally:
+        shutil.rmtree(root)
+    
+    return True
+
+def test_streaming_loader():
+    """Test the memory-mapped streaming loader used by ModelTrainer"""
+    print("\nTesting streaming data loader...")
+    
+    from dataset_writer import ShardedDatasetWriter
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai"))
+    from data_loader import StreamingDataLoader, find_datasets
+    
+    root = tempfile.mkdtemp()
+    try:
+        for dataset in range(2):
+            writer = ShardedDatasetWriter(f"dataset-{dataset}", root=root, shard_rows=30)
+            for i in range(100):
+                writer.write({"input": f"Input {dataset}-{i}", "output": "Output", "metadata": {}})
+            writer.close()
+        
+        datasets = find_datasets(root)
+        assert len(datasets) == 2
+        loader = StreamingDataLoader(datasets, batch_size=8, shuffle_buffer_size=50, readers=3, seed=7)
+        batches = list(loader.iter_batches())
+        inputs = [sample["input"] for batch in batches for sample in batch]
+        assert len(loader) == 200 and sorted(inputs) == sorted(f"Input {d}-{i}" for d in range(2) for i in range(100))
+        assert [len(batch) for batch in batches] == [8] * 25
+        print(f"✓ Every sample streamed once in {len(batches)} batches")
+        
+        same_seed = StreamingDataLoader(datasets, batch_size=8, shuffle_buffer_size=50, readers=1, seed=7)
+        assert [s["input"] for s in same_seed.iter_samples()] == inputs
+        assert [s["input"] for s in loader.iter_samples(epoch=1)] != inputs
+        assert inputs != sorted(inputs)
+        print("✓ Deterministic for a seed, reshuffled per epoch")
+        
+        limited = StreamingDataLoader(datasets, batch_size=8, seed=7, max_samples=20)
+        assert sum(len(batch) for batch in limited) == len(limited) == 20
+        print("✓ Sample limit respected")
+    finally:
+        shutil.rmtree(root)
+    
+    return True
+
+def test_validation_split():
+    """Test the hash-based train/validation split"""
+    print("\nTesting validation split...")
+    
+    from database import SupabaseService
+    from dataset_writer import assign_split, read_manifest
+    from etl_pipeline import DataETLPipeline
+    
+    splits = [assign_split(f"interaction-{i}", 0.1) for i in range(10000)]
+    assert 900 < splits.count("validation") < 1100
+    assert splits == [assign_split(f"interaction-{i}", 0.1) for i in range(10000)]
+    wider = [assign_split(f"interaction-{i}", 0.2) for i in range(10000)]
+    assert all(w == "validation" for s, w in zip(splits, wider) if s == "validation")
+    print(f"✓ Stable split: {splits.count('validation')} of {len(splits)} in validation")
+    
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai"))
+    from config import MODEL_CONFIG
+    import dataset_writer
+    assert dataset_writer.VALIDATION_SPLIT == MODEL_CONFIG["training"]["validation_split"]
+    print("✓ Writer takes its split from MODEL_CONFIG")
+    
+    class MockDBService(SupabaseService):
+        def save_training_data_items(self, items: List[Any], chunk_size: Optional[int] = None) -> int:
+            return len(items)
+        
+        def __init__(self):
+            pass  # Don't call parent __init__ to avoid Supabase connection
+    
+    interactions = [
+        {"id": f"interaction-{i}", "input_text": f"Input {i}", "structured_prompt": f"Prompt {i}", "feedback_score": 5}
+        for i in range(500)
+    ]
+    root = tempfile.mkdtemp()
+    try:
+        pipeline = DataETLPipeline(MockDBService(), dataset_dir=root)
+        samples = pipeline.stream_training_samples(interactions, validation_split=0.1)
+        dataset_id = pipeline.load_training_dataset(samples)
+        manifest = read_manifest(os.path.join(root, dataset_id))
+        expected = sum(1 for i in range(500) if assign_split(f"interaction-{i}", 0.1) == "validation")
+        assert manifest["splits"] == {"train": 500 - expected, "validation": expected}
+        print(f"✓ Splits written as separate shards: {manifest['splits']}")
+    finally:
+        shutil.rmtree(root)
+    
+    return True
+
 def test_model_training():
     """Test model training components"""
     print("\nTesting model training components...")
@@ -253,6 +649,15 @@ def main():
         test_imports,
         test_models,
         test_etl_pipeline,
+        test_streaming_etl,
+        test_near_duplicates,
+        test_parallel_etl,
+        test_app_import_in_spawned_worker,
+        test_stratified_sampling,
+        test_content_filter,
+        test_sharded_dataset,
+        test_streaming_loader,
+        test_validation_split,
         test_model_training,
         test_scheduler
     ]
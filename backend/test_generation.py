@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Test script for the Kalimtak generation path
+This script verifies orchestrator pooling and the components in front of it.
+"""
+
+import sys
+import os
+import asyncio
+import time
+from typing import List, Tuple
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(__file__))
+
+class FailingChain:
+    """Chain stub whose every call fails"""
+
+    def run(self, **kwargs: str) -> str:
+        raise RuntimeError("endpoint unavailable")
+
+def test_orchestrator_pool():
+    """Test that pooled orchestrators are reused and health is tracked"""
+    print("Testing orchestrator pool...")
+
+    from ai_service import OrchestratorPool
+
+    pool = OrchestratorPool(size=2)
+    first = pool.generate_prompt("Sort a list", target_tool="code", language="en")
+    second = pool.generate_prompt("Sort a list", target_tool="code", language="en")
+    assert first == second
+    stats = pool.stats()
+    assert stats["size"] == 2
+    assert stats["available"] == 2
+    assert sum(instance["requests"] for instance in stats["instances"]) == 2
+    print("✓ Pooled generation successful")
+
+    # Force one instance into repeated failures and check it gets replaced
+    with pool.acquire() as orchestrator:
+        orchestrator.llm = object()
+        orchestrator.chain = FailingChain()
+        while orchestrator.is_healthy:
+            fallback = orchestrator.generate_prompt("Sort a list")
+            assert "Sort a list" in fallback
+    assert pool.replacements == 1
+    assert pool.stats()["available"] == 2
+    assert all(instance["healthy"] for instance in pool.stats()["instances"])
+    print("✓ Unhealthy orchestrator replacement successful")
+
+    return True
+
+class SlowChain:
+    """Chain stub that blocks like a slow endpoint call"""
+
+    def run(self, **kwargs: str) -> str:
+        time.sleep(0.2)
+        return f"Structured: {kwargs['input_text']}"
+
+def test_async_generation():
+    """Test that concurrent generations run off the event loop in parallel"""
+    print("\nTesting async generation...")
+
+    from ai_service import OrchestratorPool
+
+    pool = OrchestratorPool(size=4, max_concurrency=4)
+    for instance in pool._instances:  # type: ignore
+        instance.llm = object()
+        instance.chain = SlowChain()
+
+    async def run_concurrently():
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            pool.agenerate_prompt(f"input {i}") for i in range(4)
+        ])
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run_concurrently())
+    assert results == [f"Structured: input {i}" for i in range(4)]
+    # Four 200ms calls on four workers should take well under 800ms
+    assert elapsed < 0.6
+    pool.close()
+    print(f"✓ Concurrent async generation successful ({elapsed:.2f}s)")
+
+    return True
+
+def test_streaming_generation():
+    """Test that streamed chunks reassemble into the full structured prompt"""
+    print("\nTesting streaming generation...")
+
+    from ai_service import OrchestratorPool
+
+    pool = OrchestratorPool(size=1)
+    expected = pool.generate_prompt("Sort a list", target_tool="code", language="en")
+
+    async def collect():
+        return [chunk async for chunk in pool.astream_prompt("Sort a list", target_tool="code", language="en")]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 1
+    assert "".join(chunks) == expected
+    assert pool.stats()["available"] == 1
+    pool.close()
+    print(f"✓ Streaming generation successful: {len(chunks)} chunks")
+
+    return True
+
+def test_response_cache():
+    """Test LRU eviction, TTL expiry, invalidation and counters"""
+    print("\nTesting response cache...")
+
+    from response_cache import ResponseCache
+
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    key = cache.make_key("  Sort   a LIST ", "Code", "EN", "v1")
+    assert key == cache.make_key("sort a list", "code", "en", "v1")
+    assert cache.get(key) is None
+    cache.set(key, "prompt 1")
+    assert cache.get(key) == "prompt 1"
+
+    # Inserting two more entries evicts the least recently used one
+    other = cache.make_key("other", "code", "en", "v1")
+    cache.set(other, "prompt 2")
+    cache.get(key)
+    cache.set(cache.make_key("third", "code", "en", "v2"), "prompt 3")
+    assert cache.get(other) is None
+    assert cache.get(key) == "prompt 1"
+    print("✓ LRU eviction successful")
+
+    assert cache.invalidate("v1") == 1
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 3
+    assert stats["evictions"] == 1
+    print("✓ Model version invalidation successful")
+
+    expiring = ResponseCache(max_entries=10, ttl_seconds=0.05)
+    expiring.set(key, "prompt 1")
+    time.sleep(0.1)
+    assert expiring.get(key) is None
+    assert expiring.stats()["expirations"] == 1
+    print("✓ TTL expiry successful")
+
+    return True
+
+def test_deploy_invalidates_cache():
+    """Test that deploying a model version drops cached prompts of the previous one"""
+    print("\nTesting cache invalidation on deploy...")
+
+    from response_cache import get_response_cache
+    from model_training import ModelRegistry, get_active_model_version
+
+    cache = get_response_cache()
+    previous_version = get_active_model_version()
+    key = cache.make_key("Sort a list", "code", "en", previous_version)
+    cache.set(key, "old prompt")
+
+    registry = ModelRegistry(None)  # type: ignore
+    assert registry.deploy_model("test-v2.0")
+    assert get_active_model_version() == "test-v2.0"
+    assert cache.get(key) is None
+    registry.deploy_model(previous_version)
+    print("✓ Deploy invalidation successful")
+
+    return True
+
+def test_training_cycle_keeps_served_version():
+    """Test that a simulated training cycle registers its version without serving it"""
+    print("\nTesting training cycle without auto-deploy...")
+
+    import tempfile
+    import model_training
+    from response_cache import get_response_cache
+    from sqlite_storage import SQLiteStorage
+
+    cache = get_response_cache()
+    served_version = model_training.get_active_model_version()
+    key = cache.make_key("Sort a list", "code", "en", served_version)
+    cache.set(key, "cached prompt")
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = SQLiteStorage(os.path.join(directory, "kalimtak.db"))
+        try:
+            orchestrator = model_training.ModelTrainingOrchestrator(db)
+            orchestrator.etl_pipeline.dataset_dir = directory
+            new_version = orchestrator.run_full_training_cycle()
+        finally:
+            db.close()
+
+    assert model_training.MODEL_AUTO_DEPLOY is False
+    assert new_version != served_version
+    assert model_training.get_active_model_version() == served_version
+    assert cache.get(key) == "cached prompt"
+    print(f"✓ Registered {new_version}, still serving {served_version}")
+
+    return True
+
+def test_single_flight():
+    """Test that identical concurrent calls share one upstream call"""
+    print("\nTesting request coalescing...")
+
+    from request_coalescing import SingleFlight
+
+    flights = SingleFlight()
+    upstream_calls: List[str] = []
+
+    async def slow_generation() -> str:
+        upstream_calls.append("call")
+        await asyncio.sleep(0.1)
+        return "shared prompt"
+
+    async def burst():
+        return await asyncio.gather(*[
+            flights.do("same-key", slow_generation, timeout=1) for _ in range(10)
+        ])
+
+    results = asyncio.run(burst())
+    assert results == ["shared prompt"] * 10
+    assert len(upstream_calls) == 1
+    assert flights.stats() == {"in_flight": 0, "calls": 1, "coalesced": 9, "timeouts": 0}
+    print("✓ Identical requests coalesced into one call")
+
+    # A caller with a short timeout gives up without cancelling the shared call
+    async def impatient_and_patient():
+        impatient = flights.do("other-key", slow_generation, timeout=0.01)
+        patient = flights.do("other-key", slow_generation, timeout=1)
+        return await asyncio.gather(impatient, patient, return_exceptions=True)
+
+    impatient_result, patient_result = asyncio.run(impatient_and_patient())
+    assert isinstance(impatient_result, asyncio.TimeoutError)
+    assert patient_result == "shared prompt"
+    assert flights.stats()["timeouts"] == 1
+    print("✓ Per-request timeouts respected")
+
+    return True
+
+def test_micro_batcher():
+    """Test that requests within one window are sent upstream as one batch"""
+    print("\nTesting micro-batching...")
+
+    from ai_service import OrchestratorPool
+    from micro_batcher import MicroBatcher
+
+    pool = OrchestratorPool(size=1)
+    upstream_batches: List[int] = []
+
+    async def generate_batch(requests: List[Tuple[str, str, str]]) -> List[str]:
+        upstream_batches.append(len(requests))
+        return await pool.agenerate_prompts(requests)
+
+    batcher: MicroBatcher[Tuple[str, str, str], str] = MicroBatcher(
+        generate_batch, max_batch_size=4, window_ms=20
+    )
+
+    async def burst():
+        return await asyncio.gather(*[
+            batcher.submit((f"input {i}", "code", "en")) for i in range(6)
+        ])
+
+    results = asyncio.run(burst())
+    assert results == [pool.generate_prompt(f"input {i}", "code", "en") for i in range(6)]
+    # Four requests fill the first batch, the other two wait for the window
+    assert upstream_batches == [4, 2]
+    stats = batcher.stats()
+    assert stats["batch_size_counts"] == {2: 1, 4: 1}
+    assert stats["max_queue_delay_ms"] >= 15
+    pool.close()
+    print(f"✓ Micro-batching successful: batches {upstream_batches}")
+
+    async def short_batch(requests: List[str]) -> List[str]:
+        return requests[:-1]
+
+    async def failing_batch(requests: List[str]) -> List[str]:
+        raise RuntimeError("endpoint unavailable")
+
+    for batch_fn in (short_batch, failing_batch):
+        failing: MicroBatcher[str, str] = MicroBatcher(batch_fn, max_batch_size=3, window_ms=20)
+
+        async def failing_burst():
+            return await asyncio.wait_for(asyncio.gather(
+                *[failing.submit(f"input {i}") for i in range(3)], return_exceptions=True
+            ), timeout=1)
+
+        outcomes = asyncio.run(failing_burst())
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes), outcomes
+    print("✓ Short or failed batches fail every waiting request")
+
+    return True
+
+def main():
+    """Run generation tests"""
+    print("Kalimtak Generation Path Test Suite")
+    print("=" * 50)
+
+    tests = [
+        test_orchestrator_pool,
+        test_async_generation,
+        test_streaming_generation,
+        test_response_cache,
+        test_deploy_invalidates_cache,
+        test_training_cycle_keeps_served_version,
+        test_single_flight,
+        test_micro_batcher
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ Test {test.__name__} failed with exception: {e}")
+            failed += 1
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+
+    if failed == 0:
+        print("🎉 All tests passed! The generation path is working correctly.")
+        return 0
+    else:
+        print("❌ Some tests failed. Please check the implementation.")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
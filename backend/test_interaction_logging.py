@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Test script for Kalimtak interaction logging
+This script verifies that interactions reach the database in bulk and survive failures.
+"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, List
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from database import SupabaseService
+from models import UserInteraction
+
+class MockDBService(SupabaseService):
+    """Records bulk inserts and fails the first `failures` calls"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.inserted_batches: List[List[UserInteraction]] = []
+
+    def log_user_interactions(self, interactions: List[UserInteraction]) -> bool:
+        if self.failures > 0:
+            self.failures -= 1
+            return False
+        self.inserted_batches.append(list(interactions))
+        return True
+
+def make_interaction(index: int) -> UserInteraction:
+    """Build a minimal interaction for logging tests"""
+    return UserInteraction(
+        id=f"interaction-{index}",
+        input_text=f"Test input {index}",
+        structured_prompt=f"Test structured prompt {index}",
+        model_output=f"Test model output {index}",
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc)
+    )
+
+def test_batched_logger():
+    """Test that queued interactions are flushed in bulk and on shutdown"""
+    print("Testing batched interaction logger...")
+
+    from interaction_logger import BatchedInteractionLogger
+
+    mock_db = MockDBService()
+    logger = BatchedInteractionLogger(mock_db, batch_size=10, flush_interval_seconds=5)
+    logger.start()
+    assert logger.submit_many([make_interaction(i) for i in range(25)]) == 25
+    logger.stop()
+
+    batch_sizes = [len(batch) for batch in mock_db.inserted_batches]
+    assert sum(batch_sizes) == 25
+    assert max(batch_sizes) <= 10
+    stats = logger.stats()
+    assert stats["flushed"] == 25
+    assert stats["queue_depth"] == 0
+    print(f"✓ Bulk flush successful: batches {batch_sizes}")
+
+    return True
+
+def test_logger_retries_and_backpressure():
+    """Test retries on failed inserts and dropping when the queue is full"""
+    print("\nTesting logger retries and backpressure...")
+
+    from interaction_logger import BatchedInteractionLogger
+
+    mock_db = MockDBService(failures=2)
+    logger = BatchedInteractionLogger(
+        mock_db, max_queue_size=3, batch_size=10, flush_interval_seconds=0.05, retry_backoff_seconds=0.01
+    )
+    accepted = logger.submit_many([make_interaction(i) for i in range(5)])
+    assert accepted == 3
+    assert logger.stats()["dropped"] == 2
+    print("✓ Full queue rejects new interactions")
+
+    logger.start()
+    logger.stop()
+    stats = logger.stats()
+    assert stats["retries"] == 2
+    assert stats["flushed"] == 3
+    assert stats["failed"] == 0
+    print("✓ Failed inserts retried successfully")
+
+    return True
+
+def test_logger_overflow_off_caller_thread():
+    """Test that overflow is spooled by the logger's spool thread, never by the submitting thread"""
+    print("\nTesting logger overflow spooling...")
+
+    import threading
+    from interaction_logger import BatchedInteractionLogger
+    from interaction_spool import InteractionSpool
+
+    class RecordingSpool(InteractionSpool):
+        """Remembers which thread each append ran on"""
+        def __init__(self, directory: str):
+            super().__init__(directory=directory)
+            self.append_threads: List[str] = []
+
+        def append(self, interactions: List[UserInteraction]) -> int:
+            self.append_threads.append(threading.current_thread().name)
+            return super().append(interactions)
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        mock_db = MockDBService()
+        spool = RecordingSpool(spool_dir)
+        logger = BatchedInteractionLogger(
+            mock_db, max_queue_size=2, batch_size=10, flush_interval_seconds=0.05, spool=spool
+        )
+        assert logger.submit_many([make_interaction(i) for i in range(4)]) == 4
+        assert spool.append_threads == []
+        assert logger.stats()["overflow_depth"] == 2
+        print("✓ Overflow accepted without touching the spool")
+
+        logger.start()
+        logger.stop()
+        spool.close()
+        stats = logger.stats()
+        assert stats["flushed"] == 2 and stats["spooled"] == 2 and stats["dropped"] == 0
+        assert set(spool.append_threads) == {"interaction-spooler"}
+        print(f"✓ Spool thread wrote the overflow: {stats['spooled']} spooled")
+
+    return True
+
+def test_spool_replay_after_outage():
+    """Test that failed batches are spooled and replayed, including after a restart"""
+    print("\nTesting interaction spool...")
+
+    from interaction_logger import BatchedInteractionLogger
+    from interaction_spool import InteractionSpool
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        # Database is down for every attempt of the first flush
+        mock_db = MockDBService(failures=4)
+        spool = InteractionSpool(directory=spool_dir, fsync_batch_size=10)
+        logger = BatchedInteractionLogger(
+            mock_db, batch_size=50, flush_interval_seconds=0.05, retry_backoff_seconds=0.01, spool=spool
+        )
+        logger.start()
+        logger.submit_many([make_interaction(i) for i in range(12)])
+        logger.stop()
+        spool.close()
+        assert logger.stats()["spooled"] == 12
+        assert len(spool.segments()) == 1
+        print("✓ Failed batch spooled to disk")
+
+        # A new process finds the segment and replays it once the database is back
+        restarted = InteractionSpool(directory=spool_dir)
+        assert restarted.stats()["bytes"] > 0
+        recovered_db = MockDBService(failures=1)
+        assert restarted.replay(recovered_db, batch_size=5) == 0
+        assert len(restarted.segments()) == 1
+        assert restarted.replay(recovered_db, batch_size=5) == 12
+        assert restarted.segments() == []
+        assert restarted.stats()["bytes"] == 0
+        replayed_ids = [interaction.id for batch in recovered_db.inserted_batches for interaction in batch]
+        assert replayed_ids == [f"interaction-{i}" for i in range(12)]
+        print("✓ Spool replayed after restart")
+
+    return True
+
+def test_spool_shared_directory():
+    """Test that a replay never touches another live process's segment, and recovers a dead one's"""
+    print("\nTesting shared spool directory...")
+
+    from interaction_spool import InteractionSpool
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        writer = InteractionSpool(directory=spool_dir)
+        replayer = InteractionSpool(directory=spool_dir)
+        assert writer.append([make_interaction(i) for i in range(3)]) == 3
+
+        db = MockDBService()
+        assert replayer.replay(db) == 0
+        assert writer.append([make_interaction(3)]) == 1
+        writer.close()
+        assert replayer.replay(db) == 4
+        print("✓ Only sealed segments are replayed")
+
+        # A process that dies mid-segment leaves an open segment and an unlocked owner marker
+        crashed = InteractionSpool(directory=spool_dir)
+        assert crashed.append([make_interaction(i) for i in range(4, 6)]) == 2
+        crashed.sync()
+        crashed._active.close()
+        crashed._owner_marker.close()
+
+        assert replayer.replay(db) == 2
+        replayed_ids = [interaction.id for batch in db.inserted_batches for interaction in batch]
+        assert replayed_ids == [f"interaction-{i}" for i in range(6)]
+        replayer.close()
+        assert os.listdir(spool_dir) == []
+        print("✓ Segments of a stopped process are recovered")
+
+    return True
+
+def _recover_until_stopped(spool_dir: str, ready: Any, stop: Any) -> None:
+    """Run orphan recovery in a loop, as another process sharing the spool directory would"""
+    from interaction_spool import InteractionSpool
+
+    recoverer = InteractionSpool(directory=spool_dir)
+    ready.set()
+    while not stop.is_set():
+        recoverer.recover_orphans()
+    recoverer.close()
+
+def test_spool_concurrent_recovery():
+    """Test that another process's recovery never takes the segment of a spool that is starting up"""
+    print("\nTesting spool recovery from a second process...")
+
+    import multiprocessing
+    from interaction_spool import InteractionSpool, OPEN_SUFFIX, SEALED_SUFFIX
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        context = multiprocessing.get_context("spawn")
+        ready, stop = context.Event(), context.Event()
+        recoverer = context.Process(target=_recover_until_stopped, args=(spool_dir, ready, stop))
+        recoverer.start()
+        try:
+            assert ready.wait(timeout=30)
+            spools = 500
+            for i in range(spools):
+                spool = InteractionSpool(directory=spool_dir)
+                assert spool.append([make_interaction(i)]) == 1
+                spool.sync()
+                active = [name for name in os.listdir(spool_dir) if name.endswith(f"-{spool.owner}{OPEN_SUFFIX}")]
+                assert len(active) == 1, f"spool {i} lost its open segment"
+                spool.close()
+        finally:
+            stop.set()
+            recoverer.join(timeout=10)
+
+        sealed = [name for name in os.listdir(spool_dir) if name.endswith(SEALED_SUFFIX)]
+        assert len(sealed) == spools
+        print(f"✓ {spools} spools started alongside a recovering process without losing a segment")
+
+    return True
+
+def test_spool_size_cap():
+    """Test that the spool refuses writes beyond its size cap"""
+    print("\nTesting spool size cap...")
+
+    from interaction_spool import InteractionSpool
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        line_size = len(make_interaction(0).model_dump_json()) + 1
+        spool = InteractionSpool(directory=spool_dir, max_bytes=line_size * 3, segment_bytes=line_size * 2)
+        assert spool.append([make_interaction(i) for i in range(2)]) == 2
+        assert spool.append([make_interaction(i) for i in range(2, 4)]) == 0
+        assert spool.append([make_interaction(4)]) == 1
+        spool.close()
+        stats = spool.stats()
+        assert stats["dropped"] == 2
+        assert stats["segments"] == 2
+        print("✓ Spool size cap enforced")
+
+    return True
+
+def main():
+    """Run interaction logging tests"""
+    print("Kalimtak Interaction Logging Test Suite")
+    print("=" * 50)
+
+    tests = [
+        test_batched_logger,
+        test_logger_retries_and_backpressure,
+        test_logger_overflow_off_caller_thread,
+        test_spool_replay_after_outage,
+        test_spool_shared_directory,
+        test_spool_concurrent_recovery,
+        test_spool_size_cap
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ Test {test.__name__} failed with exception: {e}")
+            failed += 1
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+
+    if failed == 0:
+        print("🎉 All tests passed! Interaction logging is working correctly.")
+        return 0
+    else:
+        print("❌ Some tests failed. Please check the implementation.")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
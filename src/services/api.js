@@ -62,7 +62,7 @@ export class ApiService {
   // Streaming prompt generation (calls onDelta for partial text and onDone when finished)
   static async generatePromptStream(data, { onDelta, onDone, onError, signal } = {}) {
     const token = await AsyncStorage.getItem('authToken');
-    const url = `${API_BASE_URL}/generate`;
+    const url = `${API_BASE_URL}/generate/stream`;
     const headers = {
       'Content-Type': 'application/json',
       ...(token && { 'Authorization': `Bearer ${token}` }),
@@ -103,4 +103,8 @@ export class ApiService {
       method: 'POST',
     });
   }
+  
+  static async getCurationJob(jobId) {
+    return this.request(`/admin/curation-jobs/${jobId}`);
+  }
 }
\ No newline at end of file
@@ -20,6 +20,7 @@ export async function streamResponse(url, init, { onDelta, onDone, onError, sign
     const reader = res.body.getReader();
     const decoder = new TextDecoder('utf-8');
     let buffer = '';
+    let doneInfo;
 
     while (true) {
       const { value, done } = await reader.read();
@@ -49,8 +50,10 @@ export async function streamResponse(url, init, { onDelta, onDone, onError, sign
         }
 
         if (parsed) {
-          // Expect { delta: 'text' } or { message: '...' }
-          if (parsed.delta) {
+          // Expect { delta: 'text' } or { message: '...' }, ending with { done: true, ... }
+          if (parsed.done) {
+            doneInfo = parsed;
+          } else if (parsed.delta) {
             onDelta && onDelta(parsed.delta);
           } else if (parsed.message) {
             onDelta && onDelta(parsed.message);
@@ -77,7 +80,7 @@ export async function streamResponse(url, init, { onDelta, onDone, onError, sign
       }
     }
 
-    if (onDone) onDone();
+    if (onDone) onDone(doneInfo);
   } catch (err) {
     if (err.name === 'AbortError') {
       onError && onError(new Error('Request aborted'));